@@ -0,0 +1,323 @@
+"""Benchmarks of the headless core (core.py) against synthetic libraries.
+
+    python benchmark.py                                 # 1k, 10k and 100k videos
+    python benchmark.py --sizes 1000 10000 --ingest-sample 50
+
+Every size gets its own library under --data-dir: a metadata JSON file, a thumbnail
+and a tiny ffmpeg-made video per entry (hard-linked copies of a few originals). It is
+generated once and reused by later runs. Results are appended to --results together
+with the project version and git commit, and each run is compared with the latest
+run of the same size from a different version so regressions stand out.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tomllib
+
+from core import (
+    SearchIndex, ThumbnailCache, VideoCatalog, VirtualGrid, ffmpeg_tool, ingest_library,
+    run_ffmpeg_tool, video_key,
+)
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+RESULTS_PATH = "benchmark_results.jsonl"
+DATA_DIR = "benchmark_data"
+SEARCH_QUERIES = 200
+THUMBNAIL_SAMPLE = 200
+GRID_WIDTH, GRID_HEIGHT = 1200, 800     # Viewport the grid model is laid out for
+REGRESSION_THRESHOLD = 0.10             # Slower by more than this fraction is flagged
+
+WORDS = ("guitar lesson cooking pasta travel vlog tokyo review camera lens python tutorial "
+         "football highlights piano cover live concert documentary space rocket launch "
+         "speedrun minecraft budget recipe workout morning routine drone footage mountain "
+         "podcast interview history ancient rome chess opening analysis jazz drums").split()
+UPLOADERS = [f"{a} {b}".title() for a in WORDS[:12] for b in ("studio", "channel", "tv", "daily")]
+
+
+def link_or_copy(source, destination):
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def make_sample_video(path):
+    """A two-second 160x90 test pattern; False if ffmpeg is not available."""
+    command = [
+        ffmpeg_tool("ffmpeg"), "-v", "error",
+        "-f", "lavfi", "-i", "testsrc=duration=2:size=160x90:rate=10",
+        "-pix_fmt", "yuv420p", "-y", path,
+    ]
+    try:
+        run_ffmpeg_tool(command)
+        return True
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        print(f"Could not generate a sample video with ffmpeg ({e}); using placeholder files.")
+        with open(path, 'wb') as f:
+            f.write(b"\0" * 1024)
+        return False
+
+
+def make_sample_thumbnails(directory, count=16):
+    from PIL import Image, ImageDraw
+    paths = []
+    for index in range(count):
+        image = Image.new("RGB", (320, 180), (index * 15 % 256, 80, 255 - index * 15 % 256))
+        ImageDraw.Draw(image).rectangle((20 + index * 10, 20, 120 + index * 10, 160), fill=(240, 240, 240))
+        path = os.path.join(directory, f"sample_{index}.jpg")
+        image.save(path, quality=85)
+        paths.append(path)
+    return paths
+
+
+def generate_library(root, size, rng):
+    """Create (or reuse) a library of `size` videos under root; returns whether the videos are real."""
+    marker = os.path.join(root, "complete.json")
+    if os.path.exists(marker):
+        with open(marker) as f:
+            return json.load(f)["real_videos"]
+    print(f"Generating a synthetic library of {size} videos in {root}...")
+    started = time.perf_counter()
+    samples = os.path.join(root, "samples")
+    for directory in ("downloads", "thumbnails", "metadata", samples):
+        os.makedirs(os.path.join(root, directory), exist_ok=True)
+    sample_video = os.path.join(samples, "sample.mp4")
+    real_videos = make_sample_video(sample_video)
+    sample_thumbnails = make_sample_thumbnails(samples)
+    for index in range(size):
+        key = video_key("Synthetic", f"{index:07d}")
+        link_or_copy(sample_video, os.path.join(root, "downloads", f"{key}.mp4"))
+        link_or_copy(sample_thumbnails[index % len(sample_thumbnails)], os.path.join(root, "thumbnails", f"{key}.jpg"))
+        metadata = {
+            "title": " ".join(rng.choices(WORDS, k=rng.randint(3, 8))).capitalize(),
+            "id": f"{index:07d}",
+            "original_url": f"https://videos.example.com/watch?v={index:07d}",
+            "duration": rng.randint(30, 7200),
+            "uploader": rng.choice(UPLOADERS),
+            "extractor": "Synthetic",
+        }
+        with open(os.path.join(root, "metadata", f"{key}.json"), 'w') as f:
+            json.dump(metadata, f)
+    with open(marker, 'w') as f:
+        json.dump({"size": size, "real_videos": real_videos}, f)
+    print(f"Generated in {time.perf_counter() - started:.1f}s.")
+    return real_videos
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def search_queries(records, rng, count):
+    """Whole words, prefixes, typos and two-word queries drawn from the library's own titles."""
+    queries = []
+    for _ in range(count):
+        words = rng.choice(records)["title"].lower().split()
+        word = rng.choice(words)
+        kind = rng.randrange(4)
+        if kind == 0:
+            queries.append(word)
+        elif kind == 1:
+            queries.append(word[:3])
+        elif kind == 2 and len(word) > 4:
+            position = rng.randrange(1, len(word) - 1)
+            queries.append(word[:position] + word[position + 1] + word[position] + word[position + 2:])
+        else:
+            queries.append(" ".join(rng.sample(words, min(2, len(words)))))
+    return queries
+
+
+def bench_startup(results):
+    """The app paints from the catalog first and syncs with the folders afterwards; time both parts."""
+    for path in ("catalog.db", "catalog.db-wal", "catalog.db-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+    _, results["startup.cold_sync_ms"] = timed(lambda: VideoCatalog().sync_library())
+    started = time.perf_counter()
+    catalog = VideoCatalog()
+    catalog.videos_after(None, 2000)
+    results["startup.first_page_ms"] = (time.perf_counter() - started) * 1000
+    _, results["startup.warm_sync_ms"] = timed(catalog.sync_library)
+    return catalog
+
+
+def bench_search(results, records, rng):
+    index = SearchIndex()
+    _, results["search.index_build_ms"] = timed(index.build, records)
+    latencies = []
+    for query in search_queries(records, rng, SEARCH_QUERIES):
+        _, ms = timed(index.search, query)
+        latencies.append(ms)
+    results["search.median_ms"] = statistics.median(latencies)
+    results["search.p95_ms"] = percentile(latencies, 0.95)
+
+
+def bench_grid(results, records):
+    grid = VirtualGrid()
+    def build():
+        grid.set_items([record for record in records if record["thumbnail_path"]],
+                       sort_key=lambda record: record["video_path"])
+        grid.set_width(GRID_WIDTH)
+    _, results["grid.build_ms"] = timed(build)
+    content_height = grid.content_height()
+    offsets = [content_height * step / 100 for step in range(100)]
+    _, ms = timed(lambda: [grid.visible_cells(offset, GRID_HEIGHT) for offset in offsets])
+    results["grid.visible_cells_us"] = ms * 1000 / len(offsets)
+
+
+def bench_thumbnails(results, records, rng):
+    sample = rng.sample(records, min(THUMBNAIL_SAMPLE, len(records)))
+    cache_dir = "thumbnail_cache_benchmark"
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    cache = ThumbnailCache(dispatch=lambda callback: callback(), make_image=lambda image: image, cache_dir=cache_dir)
+    keys = [(record["thumbnail_path"], ThumbnailCache.cache_key(record["thumbnail_path"], record["thumbnail_mtime"]))
+            for record in sample]
+    _, ms = timed(lambda: [cache.load_resized(path, key) for path, key in keys])
+    results["thumbnails.miss_ms"] = ms / len(keys)
+    _, ms = timed(lambda: [cache.load_resized(path, key) for path, key in keys])
+    results["thumbnails.disk_hit_ms"] = ms / len(keys)
+
+    # Fill the in-memory LRU through the normal request path, then time lookups
+    done = threading.Semaphore(0)
+    for record in sample:
+        cache.request(record["thumbnail_path"], record["thumbnail_mtime"], lambda image: done.release())
+    for _ in sample:
+        done.acquire()
+    _, ms = timed(lambda: [cache.lookup(record["thumbnail_path"], record["thumbnail_mtime"]) for record in sample])
+    results["thumbnails.memory_hit_us"] = ms * 1000 / len(sample)
+    cache.executor.shutdown()
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def bench_ingest(results, data_dir, count):
+    """Ingest throughput on videos that arrive without metadata or thumbnails."""
+    root = os.path.join(data_dir, f"ingest_{count}")
+    shutil.rmtree(root, ignore_errors=True)
+    os.makedirs(os.path.join(root, "downloads"))
+    sample_video = os.path.join(root, "sample.mp4")
+    if not make_sample_video(sample_video):
+        print("Skipping the ingest benchmark: it needs ffmpeg and ffprobe.")
+        return
+    for index in range(count):
+        link_or_copy(sample_video, os.path.join(root, "downloads", f"ingest_{index:05d}.mp4"))
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        updated, ms = timed(ingest_library, VideoCatalog())
+    finally:
+        os.chdir(cwd)
+    results["ingest.videos_per_s"] = len(updated) / (ms / 1000) if ms else 0
+    shutil.rmtree(root, ignore_errors=True)
+
+
+def run_size(data_dir, size, seed):
+    rng = random.Random(seed)
+    root = os.path.abspath(os.path.join(data_dir, f"library_{size}"))
+    os.makedirs(root, exist_ok=True)
+    generate_library(root, size, rng)
+    results = {}
+    cwd = os.getcwd()
+    os.chdir(root) # The catalog and scans work relative to the library folder, as in the app
+    try:
+        catalog = bench_startup(results)
+        records = catalog.all_videos()
+        bench_search(results, records, rng)
+        bench_grid(results, records)
+        bench_thumbnails(results, records, rng)
+    finally:
+        os.chdir(cwd)
+    return results
+
+
+def project_version():
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        with open(os.path.join(here, "pyproject.toml"), 'rb') as f:
+            version = tomllib.load(f)["project"]["version"]
+    except (OSError, KeyError, tomllib.TOMLDecodeError):
+        version = None
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=here, capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        commit = None
+    return version, commit
+
+
+def load_results(path):
+    try:
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def compare(entry, history):
+    """Print how entry differs from the latest run of the same size at another version."""
+    previous = next((old for old in reversed(history)
+                     if old["size"] == entry["size"] and (old["version"], old["commit"]) != (entry["version"], entry["commit"])),
+                    None)
+    if previous is None:
+        return
+    print(f"  compared with {previous['version']} ({previous['commit']}):")
+    for name, value in entry["results"].items():
+        old = previous["results"].get(name)
+        if not old or value is None:
+            continue
+        change = (value - old) / old
+        # Throughputs regress when they drop, timings when they grow
+        worse = -change if name.endswith("_per_s") else change
+        flag = "  REGRESSION" if worse > REGRESSION_THRESHOLD else ""
+        print(f"    {name:<28}{old:>12.3f} -> {value:>12.3f}  {change:+.1%}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the headless core on synthetic libraries.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--ingest-sample", type=int, default=100, help="videos ingested for the throughput figure, 0 to skip")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--results", default=RESULTS_PATH)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    version, commit = project_version()
+    history = load_results(args.results)
+    entries = []
+    for size in args.sizes:
+        results = run_size(args.data_dir, size, args.seed)
+        entries.append({"size": size, "results": results})
+    if args.ingest_sample:
+        results = {}
+        bench_ingest(results, os.path.abspath(args.data_dir), args.ingest_sample)
+        if results:
+            entries.append({"size": f"ingest_{args.ingest_sample}", "results": results})
+
+    with open(args.results, 'a') as f:
+        for entry in entries:
+            entry.update({"time": time.time(), "version": version, "commit": commit,
+                          "python": platform.python_version(), "platform": sys.platform})
+            f.write(json.dumps(entry) + "\n")
+            print(f"{entry['size']}:")
+            for name, value in entry["results"].items():
+                print(f"  {name:<28}{value:>12.3f}")
+            compare(entry, history)
+    print(f"Results appended to {args.results}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1825 @@
+"""Library, search, ingest, download and thumbnail logic, with no Tk or VLC imports.
+
+main.py builds the UI on top of this; benchmark.py and the headless commands use it directly.
+"""
+import time
+import os
+import json
+import hashlib
+import subprocess
+import shutil
+import sqlite3
+import re
+import heapq
+import uuid
+import queue
+from collections import defaultdict, OrderedDict, Counter
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+import sys
+import multiprocessing
+import bisect
+import math
+import select
+import struct
+import ctypes
+import ctypes.util
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from rapidfuzz import process, fuzz
+import threading
+import contextlib
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv')
+THUMBNAIL_EXTENSIONS = ('.webp', '.jpg', '.png')
+THUMBNAIL_SIZE = (200, 200)
+THUMBNAIL_CACHE_DIR = "thumbnail_cache"
+CARD_WIDTH = 250       # Size of one grid cell, card padding included
+CARD_HEIGHT = 300
+FFMPEG_LOCATION = r"C:\ffmpeg-7.1.1-full_build\bin"
+DOWNLOAD_QUEUE_PATH = "download_queue.json"
+MAX_CONCURRENT_DOWNLOADS = 3   # Size of the download worker pool
+MAX_DOWNLOADS_PER_HOST = 2     # Never hit one site with more than this many downloads at once
+CONCURRENT_FRAGMENT_DOWNLOADS = 4  # Fragments fetched in parallel for DASH/HLS formats
+BULK_IMPORT_PARALLELISM = 4    # Videos of one playlist/channel import downloaded at once
+BULK_IMPORT_RATE_LIMIT = 8 * 1024 * 1024  # Bytes/s shared by all downloads of one import, None for no limit
+TRACKING_PARAMETERS = {"si", "feature", "pp", "fbclid", "gclid", "igshid", "ref", "ref_src"}
+PERF_LOG_PATH = "perf_log.jsonl"  # Spans recorded by Metrics, one JSON object per line
+PERF_LOG_MAX_BYTES = 5 * 1024 * 1024
+PERF_LOG_BACKUPS = 3
+HASH_CHUNK_SIZE = 1024 * 1024   # Files are hashed in chunks of this size, never read whole
+PARTIAL_HASH_SIZE = 64 * 1024   # Bytes hashed from each end of a file by the duplicate prefilter
+STORYBOARD_DIR = "storyboards"
+STORYBOARD_TILE_WIDTH = 160     # Width of one seek-preview frame in the sprite sheet
+STORYBOARD_MAX_FRAMES = 100     # Long videos get frames further apart rather than a bigger sheet
+STORYBOARD_COLUMNS = 10
+PROXY_DIR = "proxies"
+PROXY_HEIGHT = 480              # Height of the low-resolution rendition used for browsing
+MAKE_PROXIES = True             # Only videos at least 1.5 * PROXY_HEIGHT tall get one
+POSTPROCESS_WORKERS = max(1, (os.cpu_count() or 2) // 4)  # ffmpeg processes post-processing runs at once
+FASTSTART_EXTENSIONS = ('.mp4', '.m4v', '.mov')
+
+
+def normalize_url(url):
+    """Canonical form of a url for comparisons: no tracking parameters, fragment or www/m. prefix."""
+    parts = urlparse(url.strip())
+    host = (parts.hostname or "").lower()
+    for prefix in ("www.", "m."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    if parts.port:
+        host = f"{host}:{parts.port}"
+    query = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+             if not name.startswith("utm_") and name not in TRACKING_PARAMETERS]
+    # http and https point at the same video
+    return urlunparse(("https", host, parts.path.rstrip("/") or "/", "", urlencode(sorted(query)), ""))
+
+
+def video_key(extractor, video_id):
+    """File name stem for a downloaded video: the same video gets the same key whatever url it came from."""
+    return hashlib.sha256(f"{extractor}:{video_id}".encode('utf-8')).hexdigest()
+
+
+def library_key(file_name, extensions):
+    """Return the video key a library file belongs to, or None if it is not one of ours."""
+    stem, ext = os.path.splitext(file_name)
+    if ext.lower() not in extensions:
+        return None
+    # yt-dlp downloads formats as <key>.f137.mp4 etc. before merging them into <key>.mp4
+    if re.search(r"\.f\d+(-\d+)?$", stem) or stem.endswith(".temp"):
+        return None
+    return stem
+
+
+def scan_library_dir(directory, extensions, keys=None):
+    """Return {key: (path, stat)} for the library files in directory, optionally only for some keys.
+
+    Extensions match case-insensitively and, when a key has several files, the one
+    whose extension comes first in extensions wins, so full and partial syncs agree.
+    """
+    found = {}
+    if not os.path.isdir(directory):
+        return found
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            key = library_key(entry.name, extensions)
+            if key is None or (keys is not None and key not in keys) or not entry.is_file():
+                continue
+            rank = (extensions.index(os.path.splitext(entry.name)[1].lower()), entry.name)
+            if key not in found or rank < found[key][0]:
+                found[key] = (rank, entry)
+    return {key: (entry.path, entry.stat()) for key, (_, entry) in found.items()}
+
+
+class Metrics():
+    """Timings of the stages of downloads, ingest, search and rendering.
+
+    Every span is added to per-name running totals, which the stats panel shows, and
+    written to a rotating JSON-lines log. Recording is a perf_counter call and a dict
+    update, so it stays on in normal use.
+    """
+    def __init__(self, log_path=PERF_LOG_PATH, max_bytes=PERF_LOG_MAX_BYTES, backups=PERF_LOG_BACKUPS) -> None:
+        self.log_path = log_path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.logger = None
+        self.lock = threading.Lock()
+        self.totals = {}    # span name -> {"count", "total_ms", "max_ms", "last_ms", "bytes"}
+
+    @contextlib.contextmanager
+    def span(self, name, log_over_ms=0, **fields):
+        """Time the block as `name`; fields set on the yielded dict (byte counts, results) are recorded with it."""
+        started = time.perf_counter()
+        try:
+            yield fields
+        finally:
+            self.record(name, (time.perf_counter() - started) * 1000, log_over_ms, **fields)
+
+    def record(self, name, ms, log_over_ms=0, **fields):
+        with self.lock:
+            totals = self.totals.get(name)
+            if totals is None:
+                totals = self.totals[name] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0, "bytes": 0}
+            totals["count"] += 1
+            totals["total_ms"] += ms
+            totals["max_ms"] = max(totals["max_ms"], ms)
+            totals["last_ms"] = ms
+            totals["bytes"] += fields.get("bytes") or 0
+        if self.log_path and ms >= log_over_ms:
+            self._log({"time": round(time.time(), 3), "span": name, "ms": round(ms, 3),
+                       "thread": threading.current_thread().name, **fields})
+
+    def _log(self, entry):
+        with self.lock:
+            # Under the lock: threads logging their first span at once would each add a handler
+            if self.logger is None:
+                # logging is only imported once there is something to write
+                import logging
+                import logging.handlers
+                logger = logging.getLogger("video_manager.metrics")
+                logger.propagate = False
+                logger.setLevel(logging.INFO)
+                handler = logging.handlers.RotatingFileHandler(self.log_path, maxBytes=self.max_bytes,
+                                                               backupCount=self.backups, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger.addHandler(handler)
+                self.logger = logger
+        self.logger.info(json.dumps(entry, default=str))
+
+    def snapshot(self):
+        with self.lock:
+            return {name: dict(totals) for name, totals in self.totals.items()}
+
+
+metrics = Metrics()
+
+
+def transfer_metrics_hook(status):
+    # yt-dlp progress hook: one span per finished file (video and audio streams separately)
+    if status.get("status") == "finished":
+        metrics.record("download.transfer", (status.get("elapsed") or 0) * 1000,
+                       bytes=status.get("total_bytes") or status.get("downloaded_bytes") or 0,
+                       file=os.path.basename(status.get("filename") or ""))
+
+
+def postprocessor_metrics_hook():
+    """Build a yt-dlp postprocessor hook that records each postprocessor (Merger, thumbnail conversion...) as a span."""
+    started = {}
+
+    def hook(status):
+        name = status.get("postprocessor")
+        if status.get("status") == "started":
+            started[name] = time.perf_counter()
+        elif status.get("status") == "finished" and name in started:
+            metrics.record(f"download.postprocess.{name}", (time.perf_counter() - started.pop(name)) * 1000)
+
+    return hook
+
+
+class VideoCatalog():
+    """SQLite index of the library so searches and the grid never open per-video files.
+
+    Every video is keyed by the shared stem of its files in downloads/, thumbnails/
+    and metadata/. Downloads are keyed by video_key(extractor, id), falling back to
+    the sha256 of the source url when yt-dlp reports no id; older downloads may
+    still carry url-hash keys.
+    """
+    COLUMNS = [
+        ("key", "TEXT PRIMARY KEY"),
+        ("id", "TEXT"),
+        ("title", "TEXT"),
+        ("uploader", "TEXT"),
+        ("duration", "REAL"),
+        ("original_url", "TEXT"),
+        ("extractor", "TEXT"),    # yt-dlp extractor key; with id it identifies the video across urls
+        ("video_path", "TEXT"),
+        ("thumbnail_path", "TEXT"),
+        ("thumbnail_mtime", "REAL"),  # Part of the key of the resized copy in the thumbnail cache
+        ("metadata_path", "TEXT"),
+        ("metadata_mtime", "REAL"),
+        ("video_mtime", "REAL"),
+        ("video_size", "INTEGER"),
+        ("ingested_mtime", "REAL"),  # video_mtime when ingest last probed the file, NULL if never
+        ("normalized_url", "TEXT"),  # original_url without tracking parameters, see normalize_url
+        ("content_hash", "TEXT"),    # sha256 of the video file, computed by dedupe_library
+        ("content_hash_mtime", "REAL"),  # video_mtime the hash was computed at
+        ("storyboard_path", "TEXT"),     # Seek-preview sprite sheet, see generate_storyboard
+        ("storyboard_mtime", "REAL"),    # video_mtime the storyboard was made from, even if that failed
+        ("postprocessed_mtime", "REAL"), # video_mtime after PostProcessor last handled the file
+        ("video_height", "INTEGER"),
+        ("proxy_path", "TEXT"),          # Low-resolution rendition, see PostProcessor
+        ("proxy_height", "INTEGER"),
+    ]
+    # Lowercased title/uploader copies from when searches ran in SQLite; SearchIndex replaced them
+    RETIRED_COLUMNS = ["title_lc", "uploader_lc"]
+
+    def __init__(self, db_path="catalog.db") -> None:
+        self.db_path = db_path
+        # The connection is shared between the UI thread and download threads
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+    def _create_schema(self):
+        with self.lock, self.conn:
+            columns = ", ".join(f"{name} {kind}" for name, kind in self.COLUMNS)
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS videos ({columns})")
+            # Add columns introduced after the catalog file was first created
+            existing = {row["name"] for row in self.conn.execute("PRAGMA table_info(videos)")}
+            for name, kind in self.COLUMNS:
+                if name not in existing:
+                    self.conn.execute(f"ALTER TABLE videos ADD COLUMN {name} {kind}")
+            for name in self.RETIRED_COLUMNS:
+                if name in existing:
+                    self.conn.execute(f"ALTER TABLE videos DROP COLUMN {name}")
+
+    def update(self, key, **fields):
+        """Insert or update the given columns for a video, leaving the others untouched."""
+        names = ["key", *fields]
+        placeholders = ", ".join("?" for _ in names)
+        assignments = ", ".join(f"{name}=excluded.{name}" for name in fields) or "key=key"
+        with self.lock, self.conn:
+            self.conn.execute(
+                f"INSERT INTO videos ({', '.join(names)}) VALUES ({placeholders}) "
+                f"ON CONFLICT(key) DO UPDATE SET {assignments}",
+                [key, *fields.values()],
+            )
+
+    def set_metadata(self, key, metadata, metadata_path=None, metadata_mtime=None):
+        self.update(
+            key,
+            id=metadata.get("id"),
+            extractor=metadata.get("extractor"),
+            title=metadata.get("title"),
+            uploader=metadata.get("uploader"),
+            duration=metadata.get("duration"),
+            original_url=metadata.get("original_url"),
+            normalized_url=normalize_url(metadata["original_url"]) if metadata.get("original_url") else None,
+            metadata_path=metadata_path,
+            metadata_mtime=metadata_mtime,
+        )
+
+    def remove(self, key):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM videos WHERE key = ?", (key,))
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM videos WHERE key = ?", (key,)).fetchone()
+        return dict(row) if row else None
+
+    def find_by_url(self, url):
+        """Return a downloaded video that was fetched from this url, tracking parameters aside."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT * FROM videos WHERE normalized_url = ? AND video_path IS NOT NULL LIMIT 1",
+                (normalize_url(url),),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def find_by_video_id(self, extractor, video_id):
+        """Return a downloaded video with this extractor id, whatever url it was fetched from."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT * FROM videos WHERE id = ? AND (extractor = ? OR extractor IS NULL) "
+                "AND video_path IS NOT NULL LIMIT 1",
+                (video_id, extractor),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def ingest_candidates(self):
+        """Videos that need ingesting: no metadata or thumbnail yet, or changed since they were probed."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT * FROM videos WHERE video_path IS NOT NULL AND ("
+                "(ingested_mtime IS NULL AND (metadata_path IS NULL OR thumbnail_path IS NULL)) "
+                "OR (ingested_mtime IS NOT NULL AND ingested_mtime != video_mtime))"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def storyboard_candidates(self):
+        """Videos without a storyboard for their current file."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT * FROM videos WHERE video_path IS NOT NULL AND "
+                "(storyboard_mtime IS NULL OR storyboard_mtime != video_mtime)"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def postprocess_candidates(self):
+        """Videos whose current file has not been through PostProcessor."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT * FROM videos WHERE video_path IS NOT NULL AND "
+                "(postprocessed_mtime IS NULL OR postprocessed_mtime != video_mtime)"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def videos_after(self, video_path, limit):
+        """The next page of all_videos after video_path (None for the first page)."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT * FROM videos WHERE video_path IS NOT NULL AND video_path > ? "
+                "ORDER BY video_path LIMIT ?",
+                (video_path or "", limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def all_videos(self):
+        """Every video that has a file in downloads/, in file name order like os.listdir used to give."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT * FROM videos WHERE video_path IS NOT NULL ORDER BY video_path"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def sync_library(self, downloads_dir="downloads", thumbnails_dir="thumbnails", metadata_dir="metadata"):
+        """Bring the catalog in line with the library folders.
+
+        Only directory listings are read; a metadata JSON file is opened only when its
+        mtime differs from the one recorded in the catalog, so the first run imports
+        everything and later runs only pick up what changed.
+        """
+        videos = scan_library_dir(downloads_dir, VIDEO_EXTENSIONS)
+        thumbnails = scan_library_dir(thumbnails_dir, THUMBNAIL_EXTENSIONS)
+        metadata_files = scan_library_dir(metadata_dir, ('.json',))
+
+        with self.lock:
+            known = {row["key"]: dict(row) for row in self.conn.execute("SELECT * FROM videos")}
+
+        changed = []
+        for key in set(videos) | set(thumbnails) | set(metadata_files) | set(known):
+            if self._sync_key(key, videos.get(key), thumbnails.get(key), metadata_files.get(key), known.get(key)):
+                changed.append(key)
+        print(f"Catalog synced: {len(videos)} videos, {len(changed)} entries updated.")
+        return changed
+
+    def sync_keys(self, keys, downloads_dir="downloads", thumbnails_dir="thumbnails", metadata_dir="metadata"):
+        """Re-check only the files of the given videos; returns the keys whose entry changed."""
+        # Files are picked exactly as sync_library picks them (e.g. camera .MP4 files),
+        # which needs the listings rather than a stat of <key>.mp4
+        wanted = set(keys)
+        videos = scan_library_dir(downloads_dir, VIDEO_EXTENSIONS, wanted)
+        thumbnails = scan_library_dir(thumbnails_dir, THUMBNAIL_EXTENSIONS, wanted)
+        metadata_files = scan_library_dir(metadata_dir, ('.json',), wanted)
+
+        changed = []
+        for key in dict.fromkeys(keys):
+            video, thumbnail, metadata = videos.get(key), thumbnails.get(key), metadata_files.get(key)
+            if self._sync_key(key, video, thumbnail, metadata, self.get(key)):
+                changed.append(key)
+        return changed
+
+    def _sync_key(self, key, video, thumbnail, metadata, row):
+        """Update one entry from the (path, stat) of its files, None for missing ones; True if it changed."""
+        if video is None and thumbnail is None and metadata is None:
+            # Every file of this video has disappeared from disk
+            if row is not None:
+                self.remove(key)
+                return True
+            return False
+
+        changed = False
+        if metadata is not None:
+            metadata_path, metadata_stat = metadata
+            if row is None or row["metadata_mtime"] != metadata_stat.st_mtime:
+                try:
+                    with open(metadata_path, 'r') as f:
+                        self.set_metadata(key, json.load(f), metadata_path, metadata_stat.st_mtime)
+                    changed = True
+                except (OSError, ValueError) as e:
+                    print(f"Could not read metadata file {metadata_path}: {e}")
+        elif row is not None and row["metadata_path"] is not None:
+            self.set_metadata(key, {}) # The metadata file was deleted
+            changed = True
+        if row is not None and row["original_url"] and row["normalized_url"] is None:
+            # Catalogs created before urls were normalized
+            self.update(key, normalized_url=normalize_url(row["original_url"]))
+
+        fields = {
+            "video_path": video[0] if video else None,
+            "video_mtime": video[1].st_mtime if video else None,
+            "video_size": video[1].st_size if video else None,
+            "thumbnail_path": thumbnail[0] if thumbnail else None,
+            "thumbnail_mtime": thumbnail[1].st_mtime if thumbnail else None,
+        }
+        if row is None or any(row[name] != value for name, value in fields.items()):
+            self.update(key, **fields)
+            changed = True
+        return changed
+
+def ffmpeg_location_option():
+    # The explicit ffmpeg path is often necessary for yt-dlp to find it on Windows
+    if os.path.exists(FFMPEG_LOCATION):
+        return {'ffmpeg_location': FFMPEG_LOCATION}
+    return {}
+
+
+def ffmpeg_tool(name):
+    """Path of ffmpeg/ffprobe, preferring the explicit install that yt-dlp is pointed at."""
+    if os.path.exists(FFMPEG_LOCATION):
+        return os.path.join(FFMPEG_LOCATION, name)
+    return name
+
+
+def run_ffmpeg_tool(command, low_priority=False):
+    # CREATE_NO_WINDOW only exists on Windows, where it stops a console from flashing up
+    creationflags = subprocess.CREATE_NO_WINDOW if os.name == "nt" else 0
+    if low_priority:
+        # Background work leaves the CPU to playback and the UI
+        if os.name == "nt":
+            creationflags |= subprocess.BELOW_NORMAL_PRIORITY_CLASS
+        elif shutil.which("nice"):
+            # Not preexec_fn: this runs on worker threads, where a forked child can deadlock before exec
+            command = ["nice", "-n", "10", *command]
+    return subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          creationflags=creationflags)
+
+
+def probe_video(video_path):
+    command = [
+        ffmpeg_tool("ffprobe"),
+        "-v", "error",
+        "-print_format", "json",
+        "-show_format",
+        "-show_streams",
+        video_path,
+    ]
+    return json.loads(run_ffmpeg_tool(command).stdout)
+
+
+# This is the method for extracting thumbnails from *local* video files using FFmpeg
+def get_video_thumbnail(video_path, output_thumbnail_path, timestamp_seconds=1, width=320):
+    output_dir = os.path.dirname(output_thumbnail_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    command = [
+        ffmpeg_tool("ffmpeg"),
+        "-v", "error",
+        # -ss before -i seeks on the demuxer, and skipping non-keyframes means only
+        # the keyframe at the seek point is decoded instead of everything up to it
+        "-ss", str(timestamp_seconds),
+        "-noaccurate_seek",
+        "-skip_frame", "nokey",
+        "-i", video_path,
+        "-frames:v", "1",
+        "-vf", f"scale={width}:-2",
+        "-threads", "1", # The ingest pool already runs one ffmpeg per core
+        "-y",
+        output_thumbnail_path
+    ]
+
+    try:
+        run_ffmpeg_tool(command)
+        return output_thumbnail_path
+    except subprocess.CalledProcessError as e:
+        print(f"Error generating thumbnail with FFmpeg:")
+        print(f"Command: {' '.join(command)}")
+        print(f"STDERR: {e.stderr.decode(errors='replace')}")
+        return None
+    except FileNotFoundError:
+        print("Error: FFmpeg not found in system PATH. Please ensure FFmpeg is installed and accessible.")
+        return None
+
+
+def storyboard_index_path(sprite_path):
+    return os.path.splitext(sprite_path)[0] + ".json"
+
+
+def generate_storyboard(video_path, sprite_path, probe=None, low_priority=False):
+    """Render the seek-preview sprite sheet of a video in one ffmpeg pass.
+
+    Keyframes are sampled every `interval` seconds and tiled STORYBOARD_COLUMNS wide, so
+    tile i shows the video roughly i * interval seconds in. The interval and tile layout
+    are written to a JSON index next to the sheet. Returns sprite_path, or None on failure.
+    """
+    try:
+        probe = probe or probe_video(video_path)
+    except (subprocess.CalledProcessError, FileNotFoundError, ValueError) as e:
+        print(f"ffprobe failed for {video_path}: {e}")
+        return None
+    duration = float((probe.get("format") or {}).get("duration") or 0)
+    stream = next((stream for stream in probe.get("streams", []) if stream.get("codec_type") == "video"), None)
+    if not duration or not stream or not stream.get("width") or not stream.get("height"):
+        return None # Nothing to preview, e.g. an audio-only file
+
+    interval = max(1.0, duration / STORYBOARD_MAX_FRAMES)
+    frames = min(STORYBOARD_MAX_FRAMES, math.ceil(duration / interval))
+    columns = min(STORYBOARD_COLUMNS, frames)
+    rows = math.ceil(frames / columns)
+    tile_width = STORYBOARD_TILE_WIDTH
+    tile_height = max(2, round(tile_width * stream["height"] / stream["width"] / 2) * 2)
+
+    os.makedirs(os.path.dirname(sprite_path) or ".", exist_ok=True)
+    command = [
+        ffmpeg_tool("ffmpeg"),
+        "-v", "error",
+        "-skip_frame", "nokey", # Only keyframes are decoded; fps repeats the last one in between
+        "-i", video_path,
+        "-an", "-sn",
+        "-vf", f"fps=1/{interval:.3f},scale={tile_width}:{tile_height},tile={columns}x{rows}",
+        "-frames:v", "1",
+        "-q:v", "5",
+        "-threads", "1",
+        "-y",
+        sprite_path
+    ]
+    try:
+        run_ffmpeg_tool(command, low_priority)
+    except subprocess.CalledProcessError as e:
+        print(f"Error generating storyboard for {video_path}: {e.stderr.decode(errors='replace')}")
+        return None
+    except FileNotFoundError:
+        print("Error: FFmpeg not found in system PATH. Please ensure FFmpeg is installed and accessible.")
+        return None
+    with open(storyboard_index_path(sprite_path), 'w') as f:
+        json.dump({"interval": interval, "frames": frames, "columns": columns,
+                   "tile_width": tile_width, "tile_height": tile_height, "duration": duration}, f)
+    return sprite_path
+
+
+def ingest_video(video_path, thumbnail_path=None):
+    """Ingest pool worker: probe one local file and, if asked, extract a thumbnail from it."""
+    # Workers run in other processes, so their timings travel back with the result
+    started = time.perf_counter()
+    try:
+        probe = probe_video(video_path)
+    except (subprocess.CalledProcessError, FileNotFoundError, ValueError) as e:
+        return {"error": f"ffprobe failed for {video_path}: {e}"}
+    timings = {"ingest.probe": (time.perf_counter() - started) * 1000}
+    video_format = probe.get("format") or {}
+    tags = {name.lower(): value for name, value in (video_format.get("tags") or {}).items()}
+    duration = float(video_format["duration"]) if video_format.get("duration") else None
+    metadata = {
+        "title": tags.get("title") or os.path.splitext(os.path.basename(video_path))[0],
+        "id": None,
+        "original_url": None,
+        "duration": round(duration) if duration else None,
+        "uploader": tags.get("artist") or tags.get("album_artist"),
+    }
+    if thumbnail_path:
+        # A frame a little way in is more representative than the (often black) first one
+        timestamp = min(10, duration * 0.1) if duration else 0
+        started = time.perf_counter()
+        thumbnail_path = get_video_thumbnail(video_path, thumbnail_path, timestamp)
+        timings["ingest.thumbnail"] = (time.perf_counter() - started) * 1000
+    return {"metadata": metadata, "thumbnail_path": thumbnail_path, "timings": timings}
+
+
+def ingest_library(catalog, workers=None):
+    """Give videos copied into downloads/ by hand metadata and thumbnails.
+
+    Runs ffprobe and ffmpeg across a process pool sized to the CPU count. Only files
+    without metadata or a thumbnail, or changed since they were last ingested, are
+    touched, so re-running it is cheap. Videos without a storyboard for their current
+    file get one in the same pool. Returns the keys that were updated.
+    """
+    catalog.sync_library()
+    candidates = catalog.ingest_candidates()
+    storyboard_candidates = catalog.storyboard_candidates()
+    if not candidates and not storyboard_candidates:
+        print("Ingest: library is up to date.")
+        return []
+    print(f"Ingest: processing {len(candidates)} videos, {len(storyboard_candidates)} storyboards.")
+    started = time.perf_counter()
+    os.makedirs("metadata", exist_ok=True)
+    os.makedirs("thumbnails", exist_ok=True)
+    updated = []
+    storyboards = 0
+    # Workers must not be forked from the app, whose Tk, VLC and download threads could
+    # leave them deadlocked; forkserver forks them from a clean single-threaded process
+    start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                             mp_context=multiprocessing.get_context(start_method)) as pool:
+        futures = {}
+        for record in storyboard_candidates:
+            sprite_path = os.path.join(STORYBOARD_DIR, f"{record['key']}.jpg")
+            futures[pool.submit(generate_storyboard, record["video_path"], sprite_path)] = (record, None)
+        for record in candidates:
+            # Metadata from yt-dlp (it has an id) is better than anything ffprobe finds, keep it
+            from_ingest = record["ingested_mtime"] is not None and record["id"] is None
+            needs_thumbnail = record["thumbnail_path"] is None or from_ingest
+            thumbnail_path = os.path.join("thumbnails", f"{record['key']}.webp") if needs_thumbnail else None
+            futures[pool.submit(ingest_video, record["video_path"], thumbnail_path)] = (record, from_ingest)
+        for future in as_completed(futures):
+            record, from_ingest = futures[future]
+            key = record["key"]
+            try:
+                result = future.result()
+            except Exception as e:
+                # One bad file (e.g. an unparsable duration tag) must not end the whole run;
+                # like an ffprobe error, it is only retried once the file changes
+                print(f"Ingest failed for {record['video_path']}: {e}")
+                if from_ingest is None:
+                    catalog.update(key, storyboard_path=None, storyboard_mtime=record["video_mtime"])
+                else:
+                    catalog.update(key, ingested_mtime=record["video_mtime"])
+                continue
+            if from_ingest is None: # A storyboard
+                catalog.update(key, storyboard_path=result, storyboard_mtime=record["video_mtime"])
+                storyboards += 1
+                if key not in updated:
+                    updated.append(key)
+                continue
+            for name, ms in result.get("timings", {}).items():
+                metrics.record(name, ms, key=key)
+            if "error" in result:
+                print(result["error"])
+                # Remember the attempt so an unreadable file is only retried once it changes
+                catalog.update(key, ingested_mtime=record["video_mtime"])
+                continue
+            if record["metadata_path"] is None or from_ingest:
+                metadata_path = os.path.join("metadata", f"{key}.json")
+                with open(metadata_path, 'w') as f:
+                    json.dump(result["metadata"], f, indent=4)
+                catalog.set_metadata(key, result["metadata"], metadata_path, os.path.getmtime(metadata_path))
+            fields = {"ingested_mtime": record["video_mtime"]}
+            if result["thumbnail_path"]:
+                fields["thumbnail_path"] = result["thumbnail_path"]
+                fields["thumbnail_mtime"] = os.path.getmtime(result["thumbnail_path"])
+            catalog.update(key, **fields)
+            if key not in updated:
+                updated.append(key)
+    elapsed = time.perf_counter() - started
+    metrics.record("ingest", elapsed * 1000, videos=len(updated), storyboards=storyboards)
+    print(f"Ingest: {len(updated)} videos ({storyboards} storyboards) in {elapsed:.1f}s ({len(updated) / elapsed:.1f} videos/s).")
+    return updated
+
+
+def partial_hash(path, size):
+    """Hash of the first and last PARTIAL_HASH_SIZE bytes, a cheap prefilter before hashing whole files."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        digest.update(f.read(PARTIAL_HASH_SIZE))
+        if size > 2 * PARTIAL_HASH_SIZE:
+            f.seek(-PARTIAL_HASH_SIZE, os.SEEK_END)
+            digest.update(f.read(PARTIAL_HASH_SIZE))
+    return digest.hexdigest()
+
+
+def content_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def find_duplicate_files(sizes, known_hashes=None):
+    """Group files with identical content.
+
+    sizes maps path -> size and known_hashes path -> content hash for hashes that are
+    still valid. Only files that share a size and a partial hash are hashed in full.
+    Returns the groups (lists of paths) and every full hash that was computed.
+    """
+    known_hashes = known_hashes or {}
+    by_size = defaultdict(list)
+    for path, size in sizes.items():
+        if size:
+            by_size[size].append(path)
+    computed = {}
+    groups = []
+    for size, paths in by_size.items():
+        if len(paths) < 2:
+            continue
+        by_partial = defaultdict(list)
+        for path in paths:
+            by_partial[partial_hash(path, size)].append(path)
+        for candidates in by_partial.values():
+            if len(candidates) < 2:
+                continue
+            by_content = defaultdict(list)
+            for path in candidates:
+                if path not in known_hashes:
+                    computed[path] = content_hash(path)
+                by_content[known_hashes.get(path) or computed[path]].append(path)
+            groups.extend(group for group in by_content.values() if len(group) > 1)
+    return groups, computed
+
+
+def replace_with_hardlink(source_path, duplicate_path):
+    """Point duplicate_path at source_path's data; False when the filesystem can't hardlink them."""
+    temp_path = f"{duplicate_path}.dedupe-tmp"
+    try:
+        os.link(source_path, temp_path)
+        os.replace(temp_path, duplicate_path)
+        return True
+    except OSError as e:
+        print(f"Could not hardlink {duplicate_path} to {source_path}: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return False
+
+
+def link_derived_file(source_path, target_path):
+    """Hardlink (or copy) a proxy or storyboard file made for identical content; True on success."""
+    try:
+        if not os.path.exists(target_path):
+            try:
+                os.link(source_path, target_path)
+            except OSError:
+                shutil.copyfile(source_path, target_path)
+        return True
+    except OSError as e:
+        print(f"Could not reuse {source_path} for {target_path}: {e}")
+        return False
+
+
+def adopt_hardlinked_video(catalog, duplicate, keeper, digest):
+    """Keep what was derived from a duplicate's video valid once it is a hardlink to the keeper's.
+
+    The link gives the duplicate the keeper's mtime, which would otherwise make ingest,
+    post-processing and storyboards treat it as a new file. Stamps the duplicate had
+    for its old file move to the new mtime; a proxy or storyboard only the keeper has
+    is linked under the duplicate's own names, so removing either record later never
+    takes the other's files with it.
+    """
+    video_mtime = os.path.getmtime(duplicate["video_path"])
+    old_mtime = duplicate["video_mtime"]
+    fields = {"video_mtime": video_mtime, "content_hash": digest, "content_hash_mtime": video_mtime}
+    if duplicate["ingested_mtime"] == old_mtime:
+        fields["ingested_mtime"] = video_mtime
+
+    if duplicate["storyboard_mtime"] == old_mtime:
+        fields["storyboard_mtime"] = video_mtime
+    elif keeper["storyboard_mtime"] == keeper["video_mtime"]:
+        storyboard_path = None
+        if keeper["storyboard_path"]:
+            storyboard_path = os.path.join(STORYBOARD_DIR, f"{duplicate['key']}.jpg")
+            if not (link_derived_file(keeper["storyboard_path"], storyboard_path) and
+                    link_derived_file(storyboard_index_path(keeper["storyboard_path"]), storyboard_index_path(storyboard_path))):
+                storyboard_path = False
+        if storyboard_path is not False:
+            fields.update(storyboard_path=storyboard_path, storyboard_mtime=video_mtime)
+
+    if duplicate["postprocessed_mtime"] == old_mtime:
+        fields["postprocessed_mtime"] = video_mtime
+    elif keeper["postprocessed_mtime"] == keeper["video_mtime"]:
+        proxy_path = None
+        if keeper["proxy_path"] and os.path.exists(keeper["proxy_path"]):
+            proxy_path = os.path.join(PROXY_DIR, f"{duplicate['key']}.mp4")
+            if not link_derived_file(keeper["proxy_path"], proxy_path):
+                proxy_path = False
+        if proxy_path is not False:
+            fields.update(postprocessed_mtime=video_mtime, video_height=keeper["video_height"])
+            if proxy_path:
+                fields.update(proxy_path=proxy_path, proxy_height=keeper["proxy_height"])
+    catalog.update(duplicate["key"], **fields)
+
+
+def remove_video_files(record):
+    storyboard_path = record["storyboard_path"]
+    for path in (record["video_path"], record["thumbnail_path"], record["metadata_path"], record["proxy_path"],
+                 storyboard_path, storyboard_path and storyboard_index_path(storyboard_path)):
+        if path:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def dedupe_library(catalog, remove=False):
+    """Merge duplicate videos in the library and reclaim the space they take.
+
+    Records of the same extractor id (one video downloaded through different urls)
+    are merged into one. Video and thumbnail files with identical content are then
+    replaced with hardlinks to a single copy, or deleted along with their record when
+    remove is set. Returns the number of bytes reclaimed.
+    """
+    catalog.sync_library()
+    reclaimed = 0
+    merged = 0
+
+    by_identity = defaultdict(list)
+    for record in catalog.all_videos():
+        if record["id"]:
+            by_identity[(record["extractor"], record["id"])].append(record)
+    for group in by_identity.values():
+        if len(group) < 2:
+            continue
+        # Keep the most complete record, the others' files go
+        group.sort(key=lambda record: (record["thumbnail_path"] is None, record["metadata_path"] is None, record["key"]))
+        keeper = group[0]
+        for duplicate in group[1:]:
+            if not os.path.samefile(keeper["video_path"], duplicate["video_path"]):
+                reclaimed += duplicate["video_size"] or 0
+            print(f"Merging {duplicate['key']} into {keeper['key']} ({keeper['title']}).")
+            remove_video_files(duplicate)
+            catalog.remove(duplicate["key"])
+            merged += 1
+
+    records = catalog.all_videos()
+    by_path = {record["video_path"]: record for record in records}
+    known_hashes = {record["video_path"]: record["content_hash"] for record in records
+                    if record["content_hash"] and record["content_hash_mtime"] == record["video_mtime"]}
+    groups, computed = find_duplicate_files({record["video_path"]: record["video_size"] for record in records}, known_hashes)
+    for path, digest in computed.items():
+        catalog.update(by_path[path]["key"], content_hash=digest, content_hash_mtime=by_path[path]["video_mtime"])
+    for group in groups:
+        # Prefer keeping a download (it has an extractor id) over a hand-copied file
+        group.sort(key=lambda path: (by_path[path]["id"] is None, path))
+        keeper_path = group[0]
+        for path in group[1:]:
+            linked = os.path.samefile(keeper_path, path) # By an earlier run without remove
+            duplicate = by_path[path]
+            if remove:
+                print(f"Removing {path}, identical to {keeper_path}.")
+                remove_video_files(duplicate)
+                catalog.remove(duplicate["key"])
+                merged += 1
+            elif linked:
+                continue
+            elif replace_with_hardlink(keeper_path, path):
+                print(f"Hardlinked {path} to identical {keeper_path}.")
+                adopt_hardlinked_video(catalog, duplicate, by_path[keeper_path], known_hashes.get(path) or computed[path])
+            else:
+                continue
+            if not linked:
+                reclaimed += duplicate["video_size"] or 0
+
+    thumbnails = {record["thumbnail_path"]: os.path.getsize(record["thumbnail_path"])
+                  for record in catalog.all_videos() if record["thumbnail_path"]}
+    for group in find_duplicate_files(thumbnails)[0]:
+        for path in group[1:]:
+            if not os.path.samefile(group[0], path) and replace_with_hardlink(group[0], path):
+                reclaimed += thumbnails[path]
+
+    print(f"Dedupe: {merged} duplicate videos merged, {reclaimed / 1048576:.1f} MiB reclaimed.")
+    return reclaimed
+
+
+def moov_at_front(path):
+    """True if an mp4's index (the moov atom) comes before its media data, so players need not seek to the end first."""
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return False
+            size, kind = struct.unpack(">I4s", header)
+            if kind == b"moov":
+                return True
+            if kind == b"mdat":
+                return False
+            if size == 1: # 64-bit box size follows the header
+                size = struct.unpack(">Q", f.read(8))[0] - 8
+            elif size == 0: # Box runs to the end of the file
+                return False
+            f.seek(size - 8, os.SEEK_CUR)
+
+
+def faststart_remux(video_path):
+    """Rewrite an mp4 in place with its index at the front; streams are copied, not re-encoded."""
+    stem, ext = os.path.splitext(video_path)
+    temp_path = f"{stem}.temp{ext}" # Ignored by the library scan until it replaces the original
+    command = [
+        ffmpeg_tool("ffmpeg"),
+        "-v", "error",
+        "-i", video_path,
+        "-map", "0",
+        "-c", "copy",
+        "-ignore_unknown",
+        "-movflags", "+faststart",
+        "-y",
+        temp_path
+    ]
+    try:
+        run_ffmpeg_tool(command, low_priority=True)
+        os.replace(temp_path, video_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def make_proxy(video_path, proxy_path, height=PROXY_HEIGHT):
+    os.makedirs(os.path.dirname(proxy_path) or ".", exist_ok=True)
+    command = [
+        ffmpeg_tool("ffmpeg"),
+        "-v", "error",
+        "-i", video_path,
+        "-vf", f"scale=-2:{height}",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "28",
+        "-c:a", "aac", "-b:a", "96k",
+        "-movflags", "+faststart",
+        "-threads", "2",
+        "-y",
+        proxy_path
+    ]
+    run_ffmpeg_tool(command, low_priority=True)
+    return proxy_path
+
+
+def postprocess_video(video_path, proxy_path=None, sprite_path=None):
+    """Faststart remux, then optionally a proxy rendition and a storyboard, for one video file."""
+    result = {"remuxed": False, "video_height": None, "proxy_path": None, "proxy_height": None, "storyboard_path": None}
+    try:
+        if os.path.splitext(video_path)[1].lower() in FASTSTART_EXTENSIONS and not moov_at_front(video_path):
+            if os.stat(video_path).st_nlink > 1:
+                # Rewriting the file would silently undo the hardlink dedupe_library made
+                print(f"Not remuxing {video_path}: it is hardlinked to an identical video.")
+            else:
+                faststart_remux(video_path)
+                result["remuxed"] = True
+        probe = probe_video(video_path)
+        stream = next((stream for stream in probe.get("streams", []) if stream.get("codec_type") == "video"), {})
+        result["video_height"] = stream.get("height")
+        if proxy_path and result["video_height"] and result["video_height"] >= PROXY_HEIGHT * 1.5:
+            result["proxy_path"] = make_proxy(video_path, proxy_path)
+            result["proxy_height"] = PROXY_HEIGHT
+    except subprocess.CalledProcessError as e:
+        return {"error": f"Post-processing {video_path} failed: {e.stderr.decode(errors='replace')}"}
+    except (OSError, ValueError) as e:
+        return {"error": f"Post-processing {video_path} failed: {e}"}
+    if sprite_path:
+        # The proxy decodes faster and its frames are no worse at storyboard size
+        result["storyboard_path"] = generate_storyboard(result["proxy_path"] or video_path, sprite_path, low_priority=True)
+    return result
+
+
+def choose_rendition(record, height):
+    """The file to play for a video shown `height` pixels tall: the proxy while it is big enough."""
+    proxy_path = record.get("proxy_path")
+    if proxy_path and height <= record["proxy_height"] * 1.25 and os.path.exists(proxy_path):
+        return proxy_path
+    return record["video_path"]
+
+
+class PostProcessor():
+    """Background faststart remux, proxy rendition and storyboard for finished videos.
+
+    A fixed number of daemon worker threads each run one ffmpeg at a time below normal
+    priority, so post-processing never competes with playback. Results go into the
+    catalog and on_done(key) is called on the worker thread.
+    """
+    def __init__(self, catalog, on_done=None, workers=POSTPROCESS_WORKERS, make_proxies=MAKE_PROXIES) -> None:
+        self.catalog = catalog
+        self.on_done = on_done
+        self.workers = workers
+        self.make_proxies = make_proxies
+        self.queue = queue.Queue()
+        self.pending = set()    # keys queued or being processed
+        self.lock = threading.Lock()
+        self.worker_count = 0
+
+    def submit(self, key):
+        with self.lock:
+            if key in self.pending:
+                return
+            self.pending.add(key)
+            # Workers are only started once there is something to do
+            while self.worker_count < self.workers:
+                threading.Thread(target=self._worker, name=f"postprocess-{self.worker_count}", daemon=True).start()
+                self.worker_count += 1
+        self.queue.put(key)
+
+    def submit_pending(self):
+        """Queue every video whose current file has not been post-processed yet."""
+        candidates = self.catalog.postprocess_candidates()
+        for record in candidates:
+            self.submit(record["key"])
+        return len(candidates)
+
+    def join(self):
+        self.queue.join()
+
+    def _worker(self):
+        while True:
+            key = self.queue.get()
+            try:
+                self._process(key)
+            except Exception as e:
+                print(f"Post-processing {key} failed: {e}")
+            finally:
+                with self.lock:
+                    self.pending.discard(key)
+                self.queue.task_done()
+
+    def _process(self, key):
+        record = self.catalog.get(key)
+        if record is None or not record["video_path"]:
+            return
+        proxy_path = os.path.join(PROXY_DIR, f"{key}.mp4") if self.make_proxies else None
+        needs_storyboard = record["storyboard_mtime"] != record["video_mtime"]
+        sprite_path = os.path.join(STORYBOARD_DIR, f"{key}.jpg") if needs_storyboard else None
+        with metrics.span("postprocess", key=key) as span:
+            result = postprocess_video(record["video_path"], proxy_path, sprite_path)
+            span.update(remuxed=result.get("remuxed"), proxy=bool(result.get("proxy_path")))
+        if "error" in result:
+            print(result["error"])
+            # Only retried once the file changes
+            self.catalog.update(key, postprocessed_mtime=record["video_mtime"])
+            return
+
+        fields = {"video_height": result["video_height"]}
+        video_mtime = record["video_mtime"]
+        if result["remuxed"]:
+            # Same streams in a new file: what was derived from the old one still holds
+            self.catalog.sync_keys([key])
+            video_mtime = self.catalog.get(key)["video_mtime"]
+            for name in ("ingested_mtime", "storyboard_mtime"):
+                if record[name] == record["video_mtime"]:
+                    fields[name] = video_mtime
+        if result["proxy_path"]:
+            fields["proxy_path"] = result["proxy_path"]
+            fields["proxy_height"] = result["proxy_height"]
+        if needs_storyboard:
+            fields["storyboard_path"] = result["storyboard_path"]
+            fields["storyboard_mtime"] = video_mtime
+        fields["postprocessed_mtime"] = video_mtime
+        self.catalog.update(key, **fields)
+        print(f"Post-processed {key}{' (remuxed)' if result['remuxed'] else ''}{' with proxy' if result['proxy_path'] else ''}.")
+        if self.on_done:
+            self.on_done(key)
+
+
+class SearchIndex():
+    """In-memory inverted token and prefix index over titles and uploaders.
+
+    Query words are matched exactly, as prefixes (search-as-you-type) and, for typos,
+    against the token vocabulary with rapidfuzz. Candidates are then ranked with a
+    single batched rapidfuzz call over precomputed choice strings.
+    """
+    TOKEN_RE = re.compile(r"\w+")
+    MAX_PREFIX = 12          # Longer query words fall back to exact/fuzzy lookups
+    FUZZY_CUTOFF = 75        # Minimum fuzz.ratio for a vocabulary token to count as a typo match
+    FUZZY_LIMIT = 25         # Vocabulary tokens considered per query word
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.records = {}                   # key -> catalog record
+        self.choices = {}                   # key -> "title uploader" lowercased, used for ranking
+        self.tokens = {}                    # key -> set of tokens for that record
+        self.postings = defaultdict(set)    # token -> keys
+        self.prefixes = defaultdict(set)    # prefix -> tokens
+        self.vocabulary = []                # token list handed to rapidfuzz, rebuilt lazily
+        self.vocabulary_dirty = False
+
+    @classmethod
+    def tokenize(cls, text):
+        return cls.TOKEN_RE.findall((text or "").lower())
+
+    def build(self, records):
+        with self.lock:
+            self.records.clear()
+            self.choices.clear()
+            self.tokens.clear()
+            self.postings.clear()
+            self.prefixes.clear()
+            for record in records:
+                self._add(record)
+            self.vocabulary_dirty = True
+
+    def add(self, record):
+        """Index a record, replacing whatever was indexed under its key before."""
+        with self.lock:
+            self._remove(record["key"])
+            if record.get("video_path"):
+                self._add(record)
+            self.vocabulary_dirty = True
+
+    def extend(self, records):
+        """Index a batch of records under one lock, e.g. a page of the catalog at startup."""
+        with self.lock:
+            for record in records:
+                self._remove(record["key"])
+                if record.get("video_path"):
+                    self._add(record)
+            self.vocabulary_dirty = True
+
+    def remove(self, key):
+        with self.lock:
+            self._remove(key)
+            self.vocabulary_dirty = True
+
+    def _add(self, record):
+        key = record["key"]
+        title = record.get("title") or ""
+        uploader = record.get("uploader") or ""
+        tokens = set(self.tokenize(title)) | set(self.tokenize(uploader))
+        self.records[key] = record
+        self.choices[key] = f"{title} {uploader}".lower()
+        self.tokens[key] = tokens
+        for token in tokens:
+            if token not in self.postings:
+                for length in range(1, min(len(token), self.MAX_PREFIX) + 1):
+                    self.prefixes[token[:length]].add(token)
+            self.postings[token].add(key)
+
+    def _remove(self, key):
+        if key not in self.records:
+            return
+        del self.records[key]
+        del self.choices[key]
+        for token in self.tokens.pop(key):
+            keys = self.postings[token]
+            keys.discard(key)
+            if not keys:
+                del self.postings[token]
+                for length in range(1, min(len(token), self.MAX_PREFIX) + 1):
+                    prefix_tokens = self.prefixes[token[:length]]
+                    prefix_tokens.discard(token)
+                    if not prefix_tokens:
+                        del self.prefixes[token[:length]]
+
+    def _match_word(self, word):
+        """Return {key: score} for the records matching a single query word."""
+        token_scores = {}
+        if len(word) <= self.MAX_PREFIX:
+            for token in self.prefixes.get(word, ()):
+                token_scores[token] = 100 if token == word else 90
+        elif word in self.postings:
+            token_scores[word] = 100
+        if len(word) >= 3:
+            if self.vocabulary_dirty:
+                self.vocabulary = list(self.postings)
+                self.vocabulary_dirty = False
+            for token, score, _ in process.extract(word, self.vocabulary, scorer=fuzz.ratio,
+                                                   score_cutoff=self.FUZZY_CUTOFF, limit=self.FUZZY_LIMIT):
+                token_scores.setdefault(token, score * 0.8)
+        key_scores = {}
+        for token, score in token_scores.items():
+            for key in self.postings[token]:
+                if score > key_scores.get(key, 0):
+                    key_scores[key] = score
+        return key_scores
+
+    def search(self, query):
+        """Return the records matching every word of the query, best match first."""
+        words = self.tokenize(query)
+        with self.lock:
+            if not words:
+                return sorted(self.records.values(), key=lambda record: record["video_path"])
+            candidates = None
+            for word in words:
+                key_scores = self._match_word(word)
+                if candidates is None:
+                    candidates = key_scores
+                else:
+                    candidates = {key: candidates[key] + score for key, score in key_scores.items() if key in candidates}
+                if not candidates:
+                    return []
+            # One batched call scores the whole query against every candidate's text
+            similarity = process.extract(" ".join(words), {key: self.choices[key] for key in candidates},
+                                         scorer=fuzz.token_set_ratio, limit=None)
+            ranked = sorted(
+                similarity,
+                key=lambda item: (candidates[item[2]] / len(words)) * 0.6 + item[1] * 0.4,
+                reverse=True,
+            )
+            return [self.records[key] for _, _, key in ranked]
+
+
+class ThumbnailCache():
+    """Pre-resized thumbnails on disk plus a bounded LRU of ready-to-show images.
+
+    Resized copies live in cache_dir under a name derived from the source path and
+    mtime, so a replaced thumbnail is picked up automatically. Decoding and resizing
+    run on a thread pool; make_image turns the PIL image into whatever the UI shows
+    and runs on the thread that dispatch schedules onto.
+    """
+    def __init__(self, dispatch, make_image, cache_dir=THUMBNAIL_CACHE_DIR, max_images=512, workers=None) -> None:
+        self.dispatch = dispatch
+        self.make_image = make_image
+        self.cache_dir = cache_dir
+        self.max_images = max_images
+        self.images = OrderedDict()     # cache key -> ready image, least recently used first
+        self.pending = {}               # cache key -> callbacks waiting on the decode pool
+        self.executor = ThreadPoolExecutor(max_workers=workers or min(4, os.cpu_count() or 1),
+                                           thread_name_prefix="thumbnail")
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def cache_key(source_path, mtime):
+        return hashlib.sha1(f"{os.path.abspath(source_path)}:{mtime}".encode('utf-8')).hexdigest()
+
+    def lookup(self, source_path, mtime):
+        """Return the ready image if it is in memory, without doing any image work."""
+        key = self.cache_key(source_path, mtime)
+        image = self.images.get(key)
+        if image is not None:
+            self.images.move_to_end(key)
+        return image
+
+    def request(self, source_path, mtime, callback):
+        """Call callback(image) with the thumbnail, straight away when it is already in memory."""
+        key = self.cache_key(source_path, mtime)
+        image = self.images.get(key)
+        if image is not None:
+            self.images.move_to_end(key)
+            callback(image)
+            return
+        if key in self.pending:
+            self.pending[key].append(callback)
+            return
+        self.pending[key] = [callback]
+        future = self.executor.submit(self.load_resized, source_path, key)
+        future.add_done_callback(lambda f: self.dispatch(lambda: self._deliver(key, f)))
+
+    def load_resized(self, source_path, key):
+        """Load the resized copy from the disk cache, creating it from the source on a miss."""
+        from PIL import Image # Imported on first use to keep it out of startup
+        cached_path = os.path.join(self.cache_dir, f"{key}.webp")
+        try:
+            with Image.open(cached_path) as cached:
+                cached.load()
+                return cached.copy()
+        except (OSError, ValueError):
+            pass
+        with Image.open(source_path) as source:
+            resized = source.convert("RGB")
+        resized.thumbnail(THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+        # Write to a temporary name first so a half-written file is never picked up
+        temp_path = f"{cached_path}.{threading.get_ident()}.tmp"
+        resized.save(temp_path, "WEBP", quality=90)
+        os.replace(temp_path, cached_path)
+        return resized
+
+    def _deliver(self, key, future):
+        callbacks = self.pending.pop(key, [])
+        try:
+            pil_image = future.result()
+        except Exception as e:
+            print(f"Could not load thumbnail: {e}")
+            return
+        image = self.make_image(pil_image)
+        self.images[key] = image
+        while len(self.images) > self.max_images:
+            self.images.popitem(last=False)
+        for callback in callbacks:
+            callback(image)
+
+
+class Storyboard():
+    """Seek previews cut from a sheet written by generate_storyboard.
+
+    The sheet is decoded once, on the first frame asked for; frame_at crops tiles from
+    it and make_image turns them into whatever the UI shows, so scrubbing never
+    decodes any video.
+    """
+    def __init__(self, sprite_path, make_image) -> None:
+        self.sprite_path = sprite_path
+        self.make_image = make_image
+        self.index = None
+        self.sheet = None
+        self.frames = {}    # tile number -> ready image
+
+    def _load(self):
+        from PIL import Image
+        try:
+            with open(storyboard_index_path(self.sprite_path)) as f:
+                self.index = json.load(f)
+            with Image.open(self.sprite_path) as sheet:
+                self.sheet = sheet.convert("RGB")
+        except (OSError, ValueError) as e:
+            print(f"Could not load storyboard {self.sprite_path}: {e}")
+            self.index = {}
+        return bool(self.sheet)
+
+    @property
+    def duration(self):
+        return (self.index or {}).get("duration", 0)
+
+    def frame_at(self, seconds):
+        """The preview image for a time in the video, or None when there is no storyboard."""
+        if self.index is None:
+            self._load()
+        if self.sheet is None:
+            return None
+        index = self.index
+        tile = min(index["frames"] - 1, max(0, int(seconds // index["interval"])))
+        if tile not in self.frames:
+            left = tile % index["columns"] * index["tile_width"]
+            top = tile // index["columns"] * index["tile_height"]
+            self.frames[tile] = self.make_image(
+                self.sheet.crop((left, top, left + index["tile_width"], top + index["tile_height"])))
+        return self.frames[tile]
+
+
+class DownloadJob():
+    """A queued download. Only the fields in PERSISTED survive a restart."""
+    PERSISTED = ("job_id", "url", "priority", "status", "title", "created", "batch_id")
+
+    def __init__(self, url, priority=0, job_id=None, status="queued", title=None, created=None, batch_id=None) -> None:
+        self.job_id = job_id or uuid.uuid4().hex
+        self.url = url
+        self.priority = priority
+        self.status = status        # queued, running, done, failed, cancelled or duplicate
+        self.title = title
+        self.created = created or time.time()
+        self.batch_id = batch_id    # Set for jobs that belong to a bulk import
+        self.host = urlparse(url).hostname or ""
+        self.video_id = None        # "extractor:id", known once the extractor has run
+        self.cancel_event = threading.Event()
+        self.completed_bytes = 0    # Bytes of files already finished (video and audio are separate files)
+        self.downloaded_bytes = 0   # Bytes of the file currently downloading
+        self.total_bytes = None
+        self.speed = None
+        self.eta = None
+
+    @property
+    def finished(self):
+        return self.status not in ("queued", "running")
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.PERSISTED}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{name: data[name] for name in cls.PERSISTED if name in data})
+
+
+class DownloadBatch():
+    """A bulk playlist/channel import: its own parallelism and bandwidth budget, and aggregate progress."""
+    PERSISTED = ("batch_id", "title", "parallelism", "rate_limit", "created")
+
+    def __init__(self, title, parallelism=BULK_IMPORT_PARALLELISM, rate_limit=BULK_IMPORT_RATE_LIMIT,
+                 batch_id=None, created=None) -> None:
+        self.batch_id = batch_id or uuid.uuid4().hex
+        self.title = title
+        self.parallelism = parallelism
+        self.rate_limit = rate_limit
+        self.created = created or time.time()
+        self.job_ids = []
+        self.started = time.monotonic()
+
+    def job_rate_limit(self):
+        # Split the import's bandwidth budget evenly over its parallel downloads
+        return self.rate_limit // self.parallelism if self.rate_limit else None
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.PERSISTED}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{name: data[name] for name in cls.PERSISTED if name in data})
+
+
+class DownloadManager():
+    """Bounded, prioritized download queue that survives restarts.
+
+    A fixed pool of worker threads runs download_fn(job) for the highest-priority job
+    whose host is below its concurrency limit. Unfinished jobs are written to
+    queue_path on every state change and picked up again on the next start; yt-dlp
+    then continues from the .part files they left behind. Nothing runs until start().
+    """
+    def __init__(self, download_fn, on_update, queue_path=DOWNLOAD_QUEUE_PATH,
+                 workers=MAX_CONCURRENT_DOWNLOADS, per_host=MAX_DOWNLOADS_PER_HOST) -> None:
+        self.download_fn = download_fn
+        self.on_update = on_update
+        self.queue_path = queue_path
+        self.per_host = per_host
+        self.condition = threading.Condition()
+        self.jobs = {}                  # job_id -> job, finished ones included until the app exits
+        self.heap = []                  # (-priority, sequence, job_id); stale entries are skipped
+        self.sequence = 0
+        self.active_hosts = Counter()
+        self.active_batches = Counter()
+        self.active_video_ids = {}      # "extractor:id" -> job_id of the job downloading it
+        self.batches = {}               # batch_id -> DownloadBatch
+        self.workers = workers
+        self.worker_count = 0
+        self.started = False
+        self._load()
+
+    def start(self):
+        """Start the worker pool, and with it the jobs resumed from queue_path.
+
+        Kept out of __init__ so no job calls back into the app before it is ready for it.
+        """
+        with self.condition:
+            self.started = True
+            self._ensure_workers(max([self.workers] + [batch.parallelism for batch in self.batches.values()]))
+
+    def _ensure_workers(self, count):
+        # The pool only grows, when an import asks for more parallelism than it has
+        if not self.started:
+            return  # start() sizes the pool for every batch queued meanwhile
+        while self.worker_count < count:
+            threading.Thread(target=self._worker, name=f"download-{self.worker_count}", daemon=True).start()
+            self.worker_count += 1
+
+    def _load(self):
+        try:
+            with open(self.queue_path, 'r') as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Could not read download queue {self.queue_path}: {e}")
+            return
+        if isinstance(saved, list):
+            saved = {"jobs": saved, "batches": []}  # Queue files written before bulk imports existed
+        for data in saved["batches"]:
+            batch = DownloadBatch.from_dict(data)
+            self.batches[batch.batch_id] = batch
+        for data in saved["jobs"]:
+            job = DownloadJob.from_dict(data)
+            job.status = "queued"  # Jobs that were running when the app closed start over (and resume)
+            self.jobs[job.job_id] = job
+            if job.batch_id in self.batches:
+                self.batches[job.batch_id].job_ids.append(job.job_id)
+            else:
+                job.batch_id = None
+            self._push(job)
+        if saved["jobs"]:
+            print(f"Resuming {len(saved['jobs'])} queued downloads.")
+
+    def _save(self):
+        # Called with the condition held; written atomically so a crash never leaves half a file
+        pending = [job for job in self.jobs.values() if not job.finished]
+        batch_ids = {job.batch_id for job in pending if job.batch_id}
+        saved = {
+            "jobs": [job.to_dict() for job in pending],
+            "batches": [self.batches[batch_id].to_dict() for batch_id in batch_ids],
+        }
+        temp_path = f"{self.queue_path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(saved, f, indent=4)
+        os.replace(temp_path, self.queue_path)
+
+    def _push(self, job):
+        self.sequence += 1
+        heapq.heappush(self.heap, (-job.priority, self.sequence, job.job_id))
+
+    def submit(self, url, priority=0):
+        """Queue a url unless an unfinished job already has it; returns the job either way."""
+        url = url.strip()
+        with self.condition:
+            for job in self.jobs.values():
+                if normalize_url(job.url) == normalize_url(url) and not job.finished:
+                    print(f"{url} is already queued.")
+                    return job
+            job = DownloadJob(url, priority)
+            self.jobs[job.job_id] = job
+            self._push(job)
+            self._save()
+            self.condition.notify()
+        self.on_update(job)
+        return job
+
+    def submit_batch(self, title, urls, parallelism=BULK_IMPORT_PARALLELISM, rate_limit=BULK_IMPORT_RATE_LIMIT):
+        """Queue every url of a bulk import as one batch, skipping urls that are already queued."""
+        batch = DownloadBatch(title, parallelism, rate_limit)
+        with self.condition:
+            queued = {normalize_url(job.url) for job in self.jobs.values() if not job.finished}
+            self.batches[batch.batch_id] = batch
+            for url in urls:
+                if normalize_url(url) in queued:
+                    continue
+                queued.add(normalize_url(url))
+                job = DownloadJob(url, batch_id=batch.batch_id)
+                self.jobs[job.job_id] = job
+                batch.job_ids.append(job.job_id)
+                self._push(job)
+            self._ensure_workers(parallelism)
+            self._save()
+            self.condition.notify_all()
+        print(f"Queued {len(batch.job_ids)} downloads for {title}.")
+        return batch
+
+    def batch_progress(self, batch_id):
+        """Aggregate progress of a batch: (done, total, bytes/s, eta in seconds or None)."""
+        with self.condition:
+            batch = self.batches[batch_id]
+            jobs = [self.jobs[job_id] for job_id in batch.job_ids]
+        finished = [job for job in jobs if job.finished]
+        downloaded = sum(job.completed_bytes + job.downloaded_bytes for job in jobs)
+        elapsed = time.monotonic() - batch.started
+        speed = downloaded / elapsed if elapsed > 0 else 0
+        # Guess the size of videos not started yet from the ones already downloaded
+        sized = [job.completed_bytes for job in finished if job.completed_bytes]
+        average_size = sum(sized) / len(sized) if sized else None
+        eta = None
+        if average_size and speed:
+            remaining = sum(max(average_size - job.completed_bytes - job.downloaded_bytes, 0)
+                            for job in jobs if not job.finished)
+            eta = remaining / speed
+        return len(finished), len(jobs), speed, eta
+
+    def cancel_batch(self, batch_id):
+        with self.condition:
+            job_ids = list(self.batches[batch_id].job_ids)
+        for job_id in job_ids:
+            self.cancel(job_id)
+
+    def set_priority(self, job_id, priority):
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if job is None or job.status != "queued":
+                return
+            job.priority = priority
+            self._push(job)
+            self._save()
+            self.condition.notify()
+        self.on_update(job)
+
+    def cancel(self, job_id):
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if job is None or job.finished:
+                return
+            job.cancel_event.set()
+            if job.status == "queued":
+                job.status = "cancelled"
+            self._save()
+        self.on_update(job)
+
+    def claim_video_id(self, job, video_id):
+        """Reserve a video id for job; False when another running job is already downloading it."""
+        with self.condition:
+            owner = self.active_video_ids.get(video_id)
+            if owner is not None and owner != job.job_id:
+                return False
+            self.active_video_ids[video_id] = job.job_id
+            job.video_id = video_id
+            return True
+
+    def progress_hook(self, job):
+        """Build a yt-dlp progress hook that records progress on job and aborts it when cancelled."""
+        last_update = [0.0]
+
+        def hook(status):
+            if job.cancel_event.is_set():
+                from yt_dlp.utils import DownloadCancelled
+                raise DownloadCancelled("Cancelled by user")
+            if status.get("status") == "finished":
+                # The next file (e.g. the audio stream) starts counting from zero again
+                job.completed_bytes += status.get("total_bytes") or status.get("downloaded_bytes") or 0
+                job.downloaded_bytes = 0
+                return
+            if status.get("status") != "downloading":
+                return
+            job.downloaded_bytes = status.get("downloaded_bytes") or 0
+            job.total_bytes = status.get("total_bytes") or status.get("total_bytes_estimate")
+            job.speed = status.get("speed")
+            job.eta = status.get("eta")
+            now = time.monotonic()
+            if now - last_update[0] >= 0.25:  # Don't flood the UI with one update per chunk
+                last_update[0] = now
+                self.on_update(job)
+
+        return hook
+
+    def _next_job(self):
+        with self.condition:
+            while True:
+                skipped = []
+                job = None
+                while self.heap:
+                    entry = heapq.heappop(self.heap)
+                    candidate = self.jobs.get(entry[2])
+                    if candidate is None or candidate.status != "queued" or -entry[0] != candidate.priority:
+                        continue  # Finished, cancelled or re-prioritized since it was pushed
+                    batch = self.batches.get(candidate.batch_id)
+                    # An import may use its own parallelism on one host instead of the per-host limit
+                    host_limit = max(self.per_host, batch.parallelism) if batch else self.per_host
+                    if (self.active_hosts[candidate.host] >= host_limit
+                            or (batch and self.active_batches[batch.batch_id] >= batch.parallelism)):
+                        skipped.append(entry)
+                        continue
+                    job = candidate
+                    break
+                for entry in skipped:
+                    heapq.heappush(self.heap, entry)
+                if job is not None:
+                    job.status = "running"
+                    self.active_hosts[job.host] += 1
+                    if job.batch_id:
+                        self.active_batches[job.batch_id] += 1
+                    self._save()
+                    return job
+                self.condition.wait()
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            self._notify(job)
+            try:
+                result = self.download_fn(job)
+            except Exception as e:
+                print(f"Download of {job.url} failed: {e}")
+                result = None
+            with self.condition:
+                if job.cancel_event.is_set():
+                    job.status = "cancelled"
+                elif job.status == "running":
+                    job.status = "done" if result else "failed"
+                self.active_hosts[job.host] -= 1
+                if job.batch_id:
+                    self.active_batches[job.batch_id] -= 1
+                if job.video_id and self.active_video_ids.get(job.video_id) == job.job_id:
+                    del self.active_video_ids[job.video_id]
+                self._save()
+                self.condition.notify_all()  # A host slot just freed up
+            self._notify(job)
+
+    def _notify(self, job):
+        # A failing callback must not kill the worker and leave its job "running" for good
+        try:
+            self.on_update(job)
+        except Exception as e:
+            print(f"Download update callback failed for {job.url}: {e}")
+
+
+class LibraryWatcher():
+    """Reports which videos changed on disk, through inotify on Linux and by polling elsewhere.
+
+    on_change(keys) is called on the watcher thread with the keys of the videos whose
+    files were created, written, moved or deleted, batched over a short debounce
+    window. It gets None when inotify lost events and the whole library needs a rescan.
+    """
+    DIRECTORIES = {"downloads": VIDEO_EXTENSIONS, "thumbnails": THUMBNAIL_EXTENSIONS, "metadata": ('.json',)}
+    IN_ATTRIB = 0x004
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_Q_OVERFLOW = 0x4000
+
+    def __init__(self, on_change, directories=None, poll_interval=2.0, debounce=0.5) -> None:
+        self.on_change = on_change
+        self.directories = directories or self.DIRECTORIES
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+
+    def start(self):
+        threading.Thread(target=self._run, name="library-watcher", daemon=True).start()
+
+    def _run(self):
+        if sys.platform.startswith("linux"):
+            try:
+                self._watch_inotify()
+                return
+            except OSError as e:
+                print(f"inotify unavailable ({e}), polling the library instead.")
+        self._watch_polling()
+
+    def _watch_inotify(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = self.IN_ATTRIB | self.IN_CLOSE_WRITE | self.IN_MOVED_FROM | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE
+        watches = {}    # watch descriptor -> directory
+        for directory in self.directories:
+            os.makedirs(directory, exist_ok=True)
+            wd = libc.inotify_add_watch(fd, os.fsencode(directory), mask)
+            if wd < 0:
+                os.close(fd)
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+            watches[wd] = directory
+
+        keys = set()
+        while True:
+            # Block until something happens, then keep collecting until it goes quiet
+            ready, _, _ = select.select([fd], [], [], self.debounce if keys else None)
+            if not ready:
+                self.on_change(keys)
+                keys = set()
+                continue
+            data = os.read(fd, 64 * 1024)
+            offset = 0
+            while offset < len(data):
+                wd, event_mask, _, name_length = struct.unpack_from("iIII", data, offset)
+                name = os.fsdecode(data[offset + 16:offset + 16 + name_length].rstrip(b"\0"))
+                offset += 16 + name_length
+                if event_mask & self.IN_Q_OVERFLOW:
+                    self.on_change(None)
+                    keys = set()
+                    continue
+                directory = watches.get(wd)
+                key = library_key(name, self.directories[directory]) if directory else None
+                if key is not None:
+                    keys.add(key)
+
+    def _snapshot(self):
+        snapshot = {}   # path -> (key, mtime, size)
+        for directory, extensions in self.directories.items():
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        key = library_key(entry.name, extensions)
+                        if key is not None:
+                            stat = entry.stat()
+                            snapshot[entry.path] = (key, stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                continue
+        return snapshot
+
+    def _watch_polling(self):
+        previous = self._snapshot()
+        while True:
+            time.sleep(self.poll_interval)
+            current = self._snapshot()
+            keys = {state[0] for path, state in current.items() if previous.get(path) != state}
+            keys |= {state[0] for path, state in previous.items() if path not in current}
+            previous = current
+            if keys:
+                self.on_change(keys)
+
+
+class VirtualGrid():
+    """Layout model of the video grid, independent of any widgets.
+
+    It knows which record sits in which cell and which cells intersect the viewport,
+    so the UI only ever builds widgets for what is (nearly) on screen.
+    """
+    def __init__(self, columns=4, cell_width=CARD_WIDTH, cell_height=CARD_HEIGHT, overscan_rows=1) -> None:
+        self.columns = columns
+        self.cell_width = cell_width
+        self.cell_height = cell_height
+        self.overscan_rows = overscan_rows
+        self.items = []
+        self.by_key = {}        # key -> item
+        self.sort_key = None    # Set when items are kept in order, e.g. the whole library by path
+
+    def set_items(self, items, sort_key=None):
+        self.items = list(items)
+        self.by_key = {item["key"]: item for item in self.items}
+        self.sort_key = sort_key
+
+    def _index_of(self, key):
+        item = self.by_key[key]
+        if self.sort_key is None:
+            return next(index for index, existing in enumerate(self.items) if existing["key"] == key)
+        index = bisect.bisect_left(self.items, self.sort_key(item), key=self.sort_key)
+        while self.items[index]["key"] != key: # Several items may share a sort key
+            index += 1
+        return index
+
+    def extend(self, items):
+        """Append items that sort after everything already in the grid."""
+        for item in items:
+            self.items.append(item)
+            self.by_key[item["key"]] = item
+
+    def upsert(self, item):
+        """Replace an item in place, or insert it at its sorted position.
+
+        Only sorted grids take new items; a list of search results keeps its members.
+        """
+        key = item["key"]
+        if key in self.by_key:
+            index = self._index_of(key)
+            if self.sort_key is None or self.sort_key(self.items[index]) == self.sort_key(item):
+                self.items[index] = item
+                self.by_key[key] = item
+                return
+            del self.items[index]
+        elif self.sort_key is None:
+            return
+        self.items.insert(bisect.bisect_right(self.items, self.sort_key(item), key=self.sort_key), item)
+        self.by_key[key] = item
+
+    def remove(self, key):
+        if key in self.by_key:
+            del self.items[self._index_of(key)]
+            del self.by_key[key]
+
+    def set_width(self, width):
+        """Fit as many columns as the viewport allows; returns True when that changed the layout."""
+        columns = max(1, int(width // self.cell_width))
+        changed = columns != self.columns
+        self.columns = columns
+        return changed
+
+    def content_height(self):
+        rows = -(-len(self.items) // self.columns)
+        return rows * self.cell_height
+
+    def clamp_offset(self, offset, viewport_height):
+        return max(0, min(offset, self.content_height() - viewport_height))
+
+    def visible_cells(self, offset, viewport_height):
+        """Return (item, x, y) for every cell near the viewport, y relative to the viewport top."""
+        first_row = max(0, int(offset // self.cell_height) - self.overscan_rows)
+        last_row = int((offset + viewport_height) // self.cell_height) + self.overscan_rows
+        start = first_row * self.columns
+        end = min(len(self.items), (last_row + 1) * self.columns)
+        cells = []
+        for index in range(start, end):
+            row, col = divmod(index, self.columns)
+            cells.append((self.items[index], col * self.cell_width, row * self.cell_height - offset))
+        return cells
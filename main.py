@@ -1,16 +1,221 @@
+import time
+STARTUP_STARTED = time.perf_counter()  # Cold start is measured from here to the first painted grid
+
 import customtkinter as ctk
-import ttkbootstrap as ttk
 import tkinter as tk
-import vlc
-import yt_dlp
 import os
-import time
 import json
 import hashlib
-import subprocess
-from PIL import Image
-from fuzzywuzzy import process, fuzz
+import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import threading
+from core import (
+    CARD_HEIGHT, CARD_WIDTH, CONCURRENT_FRAGMENT_DOWNLOADS, DownloadManager, LibraryWatcher,
+    PROXY_DIR, PostProcessor, STORYBOARD_DIR, SearchIndex, Storyboard, THUMBNAIL_SIZE,
+    ThumbnailCache, VideoCatalog, VirtualGrid, choose_rendition, dedupe_library,
+    ffmpeg_location_option, ingest_library, metrics, postprocessor_metrics_hook,
+    transfer_metrics_hook, video_key,
+)
+
+SEARCH_DEBOUNCE_MS = 150  # Wait this long after the last keystroke before searching
+SCROLL_STEP = 60       # Pixels scrolled per mouse wheel notch
+PLAYER_HEIGHT = 600    # Initial height of a player window
+STARTUP_BATCH_SIZE = 2000      # Catalog rows added to the grid per UI tick while the window starts
+FULL_RELOAD_THRESHOLD = 500    # Above this many changed videos the grid is reloaded instead of patched key by key
+STARTUP_LOG_PATH = "startup_times.jsonl"
+RENDER_LOG_OVER_MS = 16        # Grid renders only go to the log when they take longer than a frame
+PROFILE_PATH = "profile.pstats"
+
+
+def profile_ui(run):
+    """Run the UI under cProfile and tracemalloc and report the hottest functions and allocation sites.
+
+    Opt-in with `python main.py --profile`; without it neither is even imported.
+    cProfile only sees the thread that enabled it, which here is the Tk thread.
+    """
+    import cProfile
+    import pstats
+    import tracemalloc
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    profiler.enable()
+    try:
+        return run()
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        profiler.dump_stats(PROFILE_PATH)
+        print(f"Profile written to {PROFILE_PATH}.")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+        print("Top allocation sites:")
+        for stat in snapshot.statistics("lineno")[:15]:
+            print(stat)
+
+
+class PlaybackEngine():
+    """Pooled VLC players plus media that is opened before it is asked for.
+
+    libvlc is loaded on first use. open hands out a player with the media loaded and
+    its VLC events wired to callbacks; close stops it and puts it back in a small idle
+    pool instead of releasing it. preload parses a file's media on a background thread
+    (the grid calls it on hover) so that playing it starts straight away. VLC raises
+    events on its own threads, so callbacks are passed through dispatch.
+    """
+    def __init__(self, dispatch, pool_size=2, max_preloaded=8) -> None:
+        self.dispatch = dispatch
+        self.pool_size = pool_size
+        self.max_preloaded = max_preloaded
+        self.instance = None
+        self.idle_players = []
+        self.preloaded = OrderedDict()  # video path -> parsed vlc.Media, least recently hovered first
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="preload")
+
+    def _vlc(self):
+        import vlc # libvlc takes a while to load, so only do it when first needed
+        with self.lock:
+            if self.instance is None:
+                self.instance = vlc.Instance()
+        return vlc
+
+    def preload(self, video_path):
+        """Open and parse video_path in the background and warm up a player for it."""
+        with self.lock:
+            if video_path in self.preloaded:
+                self.preloaded.move_to_end(video_path)
+                return
+        self.executor.submit(self._preload, video_path)
+
+    def _preload(self, video_path):
+        vlc = self._vlc()
+        with self.lock:
+            if video_path in self.preloaded:
+                return
+        media = self.instance.media_new(video_path)
+        media.parse_with_options(vlc.MediaParseFlag.local, 0) # Asynchronous; fills in length and tracks
+        with self.lock:
+            self.preloaded[video_path] = media
+            while len(self.preloaded) > self.max_preloaded:
+                self.preloaded.popitem(last=False)[1].release()
+            if not self.idle_players:
+                self.idle_players.append(self.instance.media_player_new())
+
+    def open(self, video_path, on_time, on_length, on_end):
+        """Return a player with video_path loaded, ready for play().
+
+        on_time(ms) is called at most once per second of playback; on_length(ms) and
+        on_end() when VLC reports them. All three run on the thread dispatch schedules onto.
+        """
+        vlc = self._vlc()
+        with self.lock:
+            media = self.preloaded.pop(video_path, None)
+            player = self.idle_players.pop() if self.idle_players else self.instance.media_player_new()
+        if media is None:
+            media = self.instance.media_new(video_path)
+        player.set_media(media)
+        media.release() # The player keeps its own reference
+
+        last_second = [-1]
+        def time_changed(event):
+            new_time = event.u.new_time
+            if new_time // 1000 != last_second[0]:
+                last_second[0] = new_time // 1000
+                self.dispatch(lambda: on_time(new_time))
+
+        events = player.event_manager()
+        events.event_attach(vlc.EventType.MediaPlayerTimeChanged, time_changed)
+        events.event_attach(vlc.EventType.MediaPlayerLengthChanged,
+                            lambda event: self.dispatch(lambda length=event.u.new_length: on_length(length)))
+        events.event_attach(vlc.EventType.MediaPlayerEndReached, lambda event: self.dispatch(on_end))
+        return player
+
+    def close(self, player):
+        """Stop player, drop its callbacks and keep it for the next open."""
+        vlc = self._vlc()
+        events = player.event_manager()
+        for event_type in (vlc.EventType.MediaPlayerTimeChanged, vlc.EventType.MediaPlayerLengthChanged,
+                           vlc.EventType.MediaPlayerEndReached):
+            events.event_detach(event_type)
+        player.stop()
+        player.set_media(None)
+        with self.lock:
+            if len(self.idle_players) < self.pool_size:
+                self.idle_players.append(player)
+                return
+        player.release()
+
+    def switch(self, player, video_path):
+        """Load another rendition of what player is showing, carrying on from the same position."""
+        self._vlc()
+        position_ms = max(0, player.get_time())
+        paused = not player.is_playing()
+        media = self.instance.media_new(video_path)
+        media.add_option(f"start-time={position_ms / 1000:.3f}")
+        if paused:
+            media.add_option("start-paused")
+        player.set_media(media)
+        media.release()
+        player.play()
+
+    @staticmethod
+    def set_window(player, window_id):
+        if os.name == 'nt':
+            player.set_hwnd(window_id)
+        else:
+            player.set_xwindow(window_id)
+
+
+class VideoCard():
+    """One reusable grid card; the grid rebinds it to another record instead of destroying it."""
+    def __init__(self, manager, parent) -> None:
+        self.manager = manager
+        self.record = None
+        self.position = None
+        self.frame = ctk.CTkFrame(parent, fg_color="#0F0F0F")
+        self.image_label = ctk.CTkLabel(self.frame, text="", width=THUMBNAIL_SIZE[0], height=THUMBNAIL_SIZE[1] * 9 // 16)
+        self.image_label.pack(padx=10, pady=10)
+        self.info_label = ctk.CTkLabel(self.frame, text="", fg_color="#0F0F0F", text_color="white", width=200, height=60, wraplength=250)
+        self.info_label.pack(padx=10, pady=10)
+        for widget in (self.image_label, self.info_label):
+            widget.bind("<Button-1>", lambda e: self.manager.play_video(self.record))
+        # Hovering a card gets its media opened so a click plays without waiting on VLC
+        for widget in (self.frame, self.image_label, self.info_label):
+            widget.bind("<Enter>", lambda e: self.record and self.manager.preload_video(self.record))
+
+    def show(self, record):
+        self.record = record
+        if record["metadata_path"]:
+            video_title = record["title"] or "Unknown Title"
+            video_uploader = record["uploader"] or "Unknown Uploader"
+            video_duration = record["duration"] if record["duration"] is not None else "Unknown Duration"
+            self.info_label.configure(text=f"{video_title}\n{video_uploader}\n{video_duration} seconds")
+        else:
+            self.info_label.configure(text="Unknown Title\nUnknown Uploader\nUnknown Duration")
+
+        # Warm thumbnails come straight from memory; cold ones fill in as the pool finishes them
+        thumbnail_cache = self.manager.thumbnail_cache
+        img = thumbnail_cache.lookup(record["thumbnail_path"], record["thumbnail_mtime"])
+        self.image_label.configure(image=img if img is not None else "")
+        if img is None:
+            thumbnail_cache.request(record["thumbnail_path"], record["thumbnail_mtime"],
+                                    lambda image, key=record["key"]: self.set_image(key, image))
+
+    def set_image(self, key, image):
+        if self.record is not None and self.record["key"] == key: # The card may have been recycled meanwhile
+            self.image_label.configure(image=image)
+
+    def place(self, x, y):
+        if self.position != (x, y):
+            self.frame.place(x=x + 5, y=y + 5, width=CARD_WIDTH - 10, height=CARD_HEIGHT - 10)
+            self.position = (x, y)
+
+    def hide(self):
+        self.frame.place_forget()
+        self.position = None
+        self.record = None
+
 
 class VideoManager():
     def __init__(self) -> None:
@@ -23,154 +228,311 @@ class VideoManager():
         search_and_download_frame.pack(fill=tk.X, padx=20, pady=10)
         search_bar = ctk.CTkEntry(search_and_download_frame, placeholder_text="Enter video text or url to download...", width=400)
         search_bar.grid(row=0, column=0, padx=10, pady=10, sticky="ew")
+        # Search as you type; each keystroke restarts the debounce timer
+        search_bar.bind("<KeyRelease>", lambda e: self.schedule_search(search_bar.get()))
         search_button = ctk.CTkButton(search_and_download_frame, text="Search", command=lambda: self.search_videos(search_bar.get()))
         search_button.grid(row=0, column=1, padx=10, pady=10)
-        download_button = ctk.CTkButton(search_and_download_frame, text="⤓", command=lambda: self.start_long_running_task(search_bar.get()))
+        download_button = ctk.CTkButton(search_and_download_frame, text="⤓", command=lambda: self.queue_download(search_bar.get()))
         download_button.grid(row=0, column=2, padx=10, pady=10)
-
-
-        self.display_video_frame = ctk.CTkScrollableFrame(self.app, fg_color="#0F0F0F")
-        self.display_video_frame.pack(pady=20, padx=20, fill=tk.BOTH, expand=True)
-
-        # Initialize vlc_instance once for the application
-        self.vlc_instance = vlc.Instance()
-        # Initialize media_player to None; it will be created per playback
-        self.media_player = None
-        self.current_media = None
+        import_button = ctk.CTkButton(search_and_download_frame, text="⇊ Playlist", command=lambda: self.import_playlist(search_bar.get()))
+        import_button.grid(row=0, column=3, padx=10, pady=10)
+        ingest_button = ctk.CTkButton(search_and_download_frame, text="Ingest", command=self.start_ingest)
+        ingest_button.grid(row=0, column=4, padx=10, pady=10)
+        stats_button = ctk.CTkButton(search_and_download_frame, text="Stats", width=60, command=self.toggle_stats_panel)
+        stats_button.grid(row=0, column=5, padx=10, pady=10)
+
+
+        # The grid is virtualized: cards are placed by hand inside a fixed viewport and
+        # the scrollbar drives a virtual offset, so only on-screen cards ever exist
+        grid_container = ctk.CTkFrame(self.app, fg_color="#0F0F0F")
+        grid_container.pack(pady=20, padx=20, fill=tk.BOTH, expand=True)
+        self.grid_container = grid_container
+
+        # Download queue panel, packed above the grid while there are jobs to show
+        self.queue_panel = ctk.CTkFrame(self.app, fg_color="#2c3e50")
+        self.queue_panel_visible = False
+        self.queue_rows = {}    # job_id -> (row frame, label)
+        # Stats panel with the Metrics totals, refreshed only while it is shown
+        self.stats_panel = ctk.CTkFrame(self.app, fg_color="#2c3e50")
+        self.stats_label = ctk.CTkLabel(self.stats_panel, text="", anchor="w", justify="left", font=("Courier", 12))
+        self.stats_label.pack(fill=tk.X, padx=10, pady=5)
+        self.stats_after_id = None
+        self.grid_scrollbar = ctk.CTkScrollbar(grid_container, command=self.on_grid_scrollbar)
+        self.grid_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.display_video_frame = ctk.CTkFrame(grid_container, fg_color="#0F0F0F")
+        self.display_video_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.display_video_frame.bind("<Configure>", lambda e: self.render_visible_cards())
+        self.app.bind_all("<MouseWheel>", self.on_grid_mousewheel, add="+")
+        self.app.bind_all("<Button-4>", self.on_grid_mousewheel, add="+")
+        self.app.bind_all("<Button-5>", self.on_grid_mousewheel, add="+")
+        self.video_grid = VirtualGrid()
+        self.grid_offset = 0
+        self.grid_cards = {}    # key -> card currently placed in the viewport
+        self.spare_cards = []   # hidden cards ready to be rebound
+
+        # Every player window borrows a pooled VLC player; libvlc itself loads on first use
+        self.playback = PlaybackEngine(dispatch=lambda callback: self.app.after(0, callback))
 
         # Ensure 'downloads' and 'thumbnails' and 'metadata' directories exist
         os.makedirs("downloads", exist_ok=True)
         os.makedirs("thumbnails", exist_ok=True)
         os.makedirs("metadata", exist_ok=True)
+        os.makedirs(STORYBOARD_DIR, exist_ok=True)
+        os.makedirs(PROXY_DIR, exist_ok=True)
+
+        # The grid is first painted from the catalog as it was left last time; it is
+        # reconciled with the folders in the background once the window is up
+        self.catalog = VideoCatalog()
+
+        # Searches run on a single worker thread so typing never blocks the UI
+        self.search_index = SearchIndex()
+        self.search_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search")
+        self.search_generation = 0
+        self.search_after_id = None
+        # The index is filled page by page with the grid; searches typed before then wait for it
+        self.library_loading = True
+        self.deferred_query = None
+
+        # Thumbnails are resized once, off the main thread, and kept across refreshes
+        self.thumbnail_cache = ThumbnailCache(
+            dispatch=lambda callback: self.app.after(0, callback),
+            make_image=lambda pil_img: ctk.CTkImage(pil_img, size=pil_img.size),
+        )
+
+        # Finished downloads are remuxed for fast opening and get a proxy and a storyboard
+        self.postprocessor = PostProcessor(
+            self.catalog,
+            on_done=lambda key: self.app.after(0, self.apply_library_changes, [key]),
+        )
+
+        # Loads whatever was queued when the app last closed; run() starts the workers
+        self.downloads = DownloadManager(
+            download_fn=self.run_download_job,
+            on_update=lambda job: self.app.after(0, self.update_queue_panel, job),
+        )
+
+        # From here on only changed files are looked at: the watcher reports them by key
+        self.library_watcher = LibraryWatcher(on_change=self.on_library_changed)
+
+        self.app.after(0, self.load_library_snapshot)
+
+    def run(self):
+        # Resumed jobs report to the UI through app.after, which needs the main loop running
+        self.app.after(0, self.downloads.start)
+        self.app.mainloop()
 
+    def load_library_snapshot(self, after_path=None):
+        """Fill the grid from the catalog a batch per UI tick, then reconcile it with the folders."""
+        videos = self.catalog.videos_after(after_path, STARTUP_BATCH_SIZE)
+        self.search_index.extend(videos)
+        if after_path is None:
+            self.show_videos_on_ui(videos)
+            self.app.after_idle(self.record_startup_time)
+        else:
+            self.video_grid.extend(video for video in videos if video["thumbnail_path"])
+            self.render_visible_cards()
+        if len(videos) == STARTUP_BATCH_SIZE:
+            self.app.after(1, self.load_library_snapshot, videos[-1]["video_path"])
+            return
+        # The whole snapshot is indexed now, so searches held back meanwhile can run
+        self.library_loading = False
+        if self.deferred_query is not None:
+            self.search_videos(self.deferred_query)
+        threading.Thread(target=self.reconcile_library, daemon=True).start()
+
+    def reconcile_library(self):
+        # Runs on a background thread after the first paint
+        self.publish_library_changes(self.catalog.sync_library())
+        self.library_watcher.start()
+
+    def record_startup_time(self):
+        self.app.update_idletasks() # Make sure the first grid is actually on screen
+        seconds = time.perf_counter() - STARTUP_STARTED
+        print(f"Window interactive after {seconds:.2f}s.")
+        metrics.record("startup", seconds * 1000, videos=len(self.video_grid.items))
+        with open(STARTUP_LOG_PATH, 'a') as f:
+            f.write(json.dumps({"time": time.time(), "seconds": round(seconds, 4), "videos": len(self.video_grid.items)}) + "\n")
+
+    def schedule_search(self, query):
+        if query.startswith(("http://", "https://")):
+            return  # A url is being pasted for download, not searched for
+        if self.search_after_id is not None:
+            self.app.after_cancel(self.search_after_id)
+        self.search_after_id = self.app.after(SEARCH_DEBOUNCE_MS, lambda: self.search_videos(query))
 
-        videos = self.get_videos()
-        self.show_videos_on_ui(videos)
-
-        self.app.mainloop()
     def search_videos(self, query):
-        if query:
-            query = query.lower().split()
-            metadata_files = os.listdir("metadata")
-            matching_videos = []
-            for metadata_file in metadata_files:
-                if metadata_file.endswith('.json'):
-                    with open(os.path.join("metadata", metadata_file), 'r') as f:
-                        metadata = json.load(f)
-                        if all(word in metadata.get("title", "").lower() for word in query):
-                            matching_videos.append(metadata_file.replace('.json', '.mp4'))  # Assuming video files are named the same as metadata files
-                        elif any(word in metadata.get("uploader", "").lower() for word in query):
-                            matching_videos.append(metadata_file.replace('.json', '.mp4'))
-
-            print(f"\n\n\n{matching_videos}")
-            self.show_videos_on_ui(matching_videos)
-        else:
-            print("Search query is empty. Displaying all videos.")
-            video_files = self.get_videos()
-            self.show_videos_on_ui(video_files)
-    def get_videos(self):
-        files = os.listdir("downloads")
-        video_files = [f for f in files if f.endswith(('.mp4', '.avi', '.mkv'))]
-        return video_files
-
-    def show_videos_on_ui(self, video_files):
-        for widget in self.display_video_frame.winfo_children():
-            widget.destroy()
-        print(f"Showing {len(video_files)} videos on UI.")
-        row = 0
-        col = 0
-        for video_file in video_files:
-            video_path = os.path.join("downloads", video_file)
-            thumbnail_path = os.path.join("thumbnails", video_file)
-            thumbnail_path = thumbnail_path.replace('.mp4', '.webp')  # Adjust for thumbnail extension
-
-            if os.path.exists(thumbnail_path): # Added check for thumbnail file existence
-                # print(f"Thumbnail found for {video_file}: {thumbnail_path}")
-                pil_img = Image.open(thumbnail_path)
-
-                temp_img = pil_img.copy()
-                temp_img.thumbnail((200, 200), Image.Resampling.LANCZOS)  # Resize to fit the UI
-
-                img = ctk.CTkImage(temp_img, size=temp_img.size)
-                video_frame = ctk.CTkFrame(self.display_video_frame, fg_color="#0F0F0F")
-                video_frame.grid(row=row, column=col, padx=10, pady=10, sticky="nsew")
-                video_image_label = ctk.CTkLabel(video_frame, image=img, text="")
-                video_image_label.pack(padx=10, pady=10)
-                video_image_label.bind("<Button-1>", lambda e, path=video_path: self.play_video(path))
-
-                json_file_path = os.path.join("metadata", video_file.replace('.mp4', '.json'))
-                try:
-                    with open(json_file_path, 'r') as f:
-                        metadata = json.load(f)
-                        video_title = metadata.get("title", "Unknown Title")
-                        video_uploader = metadata.get("uploader", "Unknown Uploader")
-                        video_duration = metadata.get("duration", "Unknown Duration")
-                    video_info_label = ctk.CTkLabel(video_frame, text=f"{video_title}\n{video_uploader}\n{video_duration} seconds", fg_color="#0F0F0F", text_color="white",width=200, height=60,wraplength=250)
-                    video_info_label.pack(padx=10, pady=10)
-                    video_info_label.bind("<Button-1>", lambda e, path=video_path: self.play_video(path))
-                    # print(f"Metadata loaded for {video_file}: {video_title}, {video_uploader}, {video_duration} seconds")
-                except FileNotFoundError:
-                    print(f"Metadata file not found for {json_file_path}. Using default values.")
-                    video_info_label = ctk.CTkLabel(video_frame, text="Unknown Title\nUnknown Uploader\nUnknown Duration", fg_color="#0F0F0F", text_color="white")
-                    video_info_label.pack(padx=10, pady=10)
-
-                col += 1
-                if col > 3: # Adjust this for desired number of columns
-                    col = 0
-                    row += 1
+        self.search_after_id = None
+        if self.library_loading:
+            self.deferred_query = query # Answered by load_library_snapshot once the index is complete
+            return
+        self.search_generation += 1
+        generation = self.search_generation
+
+        def run_search():
+            if generation != self.search_generation:
+                return  # A newer query was typed while this one waited
+            with metrics.span("search", query=query) as span:
+                matching_videos = self.search_index.search(query)
+                span["results"] = len(matching_videos)
+            self.app.after(0, lambda: show_results(matching_videos))
+
+        def show_results(matching_videos):
+            if generation != self.search_generation:
+                return
+            if query.strip():
+                print(f"Search matched {len(matching_videos)} videos.")
             else:
-                print(f"Thumbnail not found for {video_file} at {thumbnail_path}. Skipping display.")
-
-
-    # This is the method for extracting thumbnails from *local* video files using FFmpeg
-    def get_video_thumbnail(self, video_path, output_thumbnail_path=None, timestamp_seconds=1, width=150, height=100):
-        if not os.path.exists(video_path):
-            print(f"Error: Video file not found at {video_path}")
-            return None
+                print("Search query is empty. Displaying all videos.")
+            self.show_videos_on_ui(matching_videos, whole_library=not SearchIndex.tokenize(query))
 
-        if not output_thumbnail_path:
-            os.makedirs("thumbnails", exist_ok=True)
-            hash_object = hashlib.md5(video_path.encode())
-            hex_dig = hash_object.hexdromd()# type: ignore
-            output_thumbnail_path = os.path.join("thumbnails", f"{hex_dig}.png")
-
-        output_dir = os.path.dirname(output_thumbnail_path)
-        if output_dir and not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-
-        command = [
-            "ffmpeg",
-            "-ss", str(timestamp_seconds),
-            "-i", video_path,
-            "-vframes", "1",
-            "-s", f"{width}x{height}",
-            "-y",
-            output_thumbnail_path
-        ]
-
-        try:
-            print(f"Attempting FFmpeg thumbnail extraction for: {video_path}")
-            subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, creationflags=subprocess.CREATE_NO_WINDOW)
-            print(f"FFmpeg thumbnail saved to: {output_thumbnail_path}")
-            return output_thumbnail_path
-        except subprocess.CalledProcessError as e:
-            print(f"Error generating thumbnail with FFmpeg:")
-            print(f"Command: {' '.join(command)}")
-            print(f"STDOUT: {e.stdout.decode()}")
-            print(f"STDERR: {e.stderr.decode()}")
-            return None
-        except FileNotFoundError:
-            print("Error: FFmpeg not found in system PATH. Please ensure FFmpeg is installed and accessible.")
-            return None
+        self.search_executor.submit(run_search)
 
-    def play_video(self, video_path):
+    def on_library_changed(self, keys):
+        # Runs on the watcher thread, so the disk and catalog work stays off the UI thread
+        if keys is None:
+            self.publish_library_changes(self.catalog.sync_library())
+        else:
+            self.publish_library_changes(self.catalog.sync_keys(keys))
+
+    def publish_library_changes(self, keys):
+        """Hand keys the catalog just changed to the UI; runs on a background thread.
+
+        A few changes are patched into the grid one by one. Large sets (a first run over
+        an existing folder, a big ingest) reload everything at once instead, with the
+        catalog read and the index rebuilt here rather than on the Tk thread.
+        """
+        if len(keys) > FULL_RELOAD_THRESHOLD:
+            videos = self.catalog.all_videos()
+            self.search_index.build(videos)
+            print(f"Library updated: {len(keys)} videos changed, reloading.")
+            self.app.after(0, self.reload_library, videos)
+        elif keys:
+            self.app.after(0, self.apply_library_changes, keys)
+
+    def reload_library(self, videos):
+        if self.video_grid.sort_key is None:
+            # Search results are on screen: refresh their members rather than showing the whole library
+            current = {video["key"]: video for video in videos}
+            results = [current[item["key"]] for item in self.video_grid.items if item["key"] in current]
+            self.show_videos_on_ui(results, keep_scroll=True, whole_library=False)
+        else:
+            self.show_videos_on_ui(videos, keep_scroll=True)
+
+    def apply_library_changes(self, keys):
+        """Push just the changed videos into the search index and the grid."""
+        for key in keys:
+            record = self.catalog.get(key)
+            if record:
+                self.search_index.add(record)
+            else:
+                self.search_index.remove(key)
+            if record and record["video_path"] and record["thumbnail_path"]:
+                self.video_grid.upsert(record)
+            else:
+                self.video_grid.remove(key)
+        print(f"Library updated: {len(keys)} videos changed.")
+        self.render_visible_cards()
+    def get_videos(self):
+        return self.catalog.all_videos()
+
+    def show_videos_on_ui(self, videos, keep_scroll=False, whole_library=True):
+        # Cards are only built for the viewport; everything else is just a list entry
+        with metrics.span("grid.build") as span:
+            videos = [video for video in videos if video["thumbnail_path"]]
+            # The whole library is kept in path order so changes can be slotted in without a reload
+            self.video_grid.set_items(videos, sort_key=(lambda video: video["video_path"]) if whole_library else None)
+            span["videos"] = len(videos)
+        print(f"Showing {len(videos)} videos on UI.")
+        if not keep_scroll:
+            self.grid_offset = 0
+        self.render_visible_cards()
+
+    def grid_viewport_size(self):
+        # Layout works in unscaled units, like the sizes passed to customtkinter widgets
+        scaling = ctk.ScalingTracker.get_widget_scaling(self.display_video_frame)
+        return self.display_video_frame.winfo_width() / scaling, self.display_video_frame.winfo_height() / scaling
+
+    def render_visible_cards(self):
+        """Diff the cards on screen against the viewport: recycle cards that left it, bind new ones, move the rest."""
+        with metrics.span("render", log_over_ms=RENDER_LOG_OVER_MS) as span:
+            span["cards"] = self._render_visible_cards()
+
+    def _render_visible_cards(self):
+        viewport_width, viewport_height = self.grid_viewport_size()
+        self.video_grid.set_width(viewport_width)
+        self.grid_offset = self.video_grid.clamp_offset(self.grid_offset, viewport_height)
+        cells = self.video_grid.visible_cells(self.grid_offset, viewport_height)
+
+        wanted = {item["key"] for item, _, _ in cells}
+        for key in [key for key in self.grid_cards if key not in wanted]:
+            card = self.grid_cards.pop(key)
+            card.hide()
+            self.spare_cards.append(card)
+
+        for item, x, y in cells:
+            card = self.grid_cards.get(item["key"])
+            if card is None:
+                card = self.spare_cards.pop() if self.spare_cards else VideoCard(self, self.display_video_frame)
+                self.grid_cards[item["key"]] = card
+                card.show(item)
+            elif card.record != item: # Same video, but its catalog entry changed
+                card.show(item)
+            card.place(x, y)
+
+        content_height = self.video_grid.content_height()
+        if content_height > viewport_height > 0:
+            self.grid_scrollbar.set(self.grid_offset / content_height, (self.grid_offset + viewport_height) / content_height)
+        else:
+            self.grid_scrollbar.set(0, 1)
+        return len(cells)
+
+    def scroll_grid_to(self, offset):
+        self.grid_offset = offset
+        self.render_visible_cards()
+
+    def on_grid_scrollbar(self, action, amount, unit=None):
+        _, viewport_height = self.grid_viewport_size()
+        if action == "moveto":
+            self.scroll_grid_to(float(amount) * self.video_grid.content_height())
+        elif action == "scroll":
+            step = viewport_height if unit == "pages" else SCROLL_STEP
+            self.scroll_grid_to(self.grid_offset + int(amount) * step)
+
+    def on_grid_mousewheel(self, event):
+        # bind_all sees every wheel event, so only react when the pointer is over the grid
+        if not str(event.widget).startswith(str(self.display_video_frame)):
+            return
+        if event.num == 4 or event.delta > 0:
+            self.scroll_grid_to(self.grid_offset - SCROLL_STEP)
+        elif event.num == 5 or event.delta < 0:
+            self.scroll_grid_to(self.grid_offset + SCROLL_STEP)
+
+    def play_video(self, record):
+        video_path = record["video_path"]
         print(f"Attempting to play video: {video_path}")
         root = ctk.CTkToplevel(self.app)
         root.title("Video Player")
-        root.geometry("800x600")
-
-        # Create a new media player instance for *this* playback
-        self.media_player = self.vlc_instance.media_player_new()# type: ignore
+        root.geometry(f"800x{PLAYER_HEIGHT}")
+
+        # Each window has its own player, so opening another video leaves this one alone
+        length_ms = [0]
+        def on_time(current_time_ms):
+            if not root.winfo_exists(): # A late event for a window that has just closed
+                return
+            if length_ms[0] > 0: # Avoid division by zero
+                if not scrubbing[0]:
+                    progress_bar.set(current_time_ms * 100 / length_ms[0])
+                current_minutes, current_seconds = divmod(current_time_ms // 1000, 60)
+                total_minutes, total_seconds = divmod(length_ms[0] // 1000, 60)
+                progress_bar_label.configure(text=f"{int(current_minutes):02}:{int(current_seconds):02} / {int(total_minutes):02}:{int(total_seconds):02}")
+        def on_length(new_length_ms):
+            length_ms[0] = new_length_ms
+        def on_end():
+            if root.winfo_exists():
+                progress_bar.set(100)
+        # A window too small to show more than the proxy plays the proxy
+        rendition = [choose_rendition(record, PLAYER_HEIGHT)]
+        player = self.playback.open(rendition[0], on_time, on_length, on_end)
 
         controls_frame = ctk.CTkFrame(root, fg_color="#2c3e50")
         controls_frame.grid(row=0, column=0, sticky="ew")
@@ -183,14 +545,14 @@ class VideoManager():
                 root.attributes("-fullscreen", False)
                 controls_frame.grid(row=0, column=0, sticky="ew")
                 
-        pause_button = ctk.CTkButton(controls_frame, text="Pause/play", command=self.pause_video)
+        pause_button = ctk.CTkButton(controls_frame, text="Pause/play", command=lambda: self.pause_video(player))
         pause_button.pack(side=tk.LEFT, padx=0, pady=0)
         
-        # The stop button should now stop the current player and close its window
-        stop_button = ctk.CTkButton(controls_frame, text="Stop", command=lambda: self._stop_and_close_player(root))
+        # The stop button hands the player back to the pool and closes its window
+        stop_button = ctk.CTkButton(controls_frame, text="Stop", command=lambda: self._stop_and_close_player(root, player))
         stop_button.pack(side=tk.LEFT, padx=0, pady=0)
 
-        volume_slider = ctk.CTkSlider(controls_frame, from_=0, to=200, command=lambda value: self.media_player.audio_set_volume(int(value)))#type: ignore
+        volume_slider = ctk.CTkSlider(controls_frame, from_=0, to=200, command=lambda value: player.audio_set_volume(int(value)))
         volume_slider.set(50)
         volume_slider.pack(side=tk.LEFT, padx=0, pady=0)
 
@@ -202,220 +564,381 @@ class VideoManager():
         root.grid_columnconfigure(0, weight=1)
         
         # Bind the configure event for resizing the video output
-        video_frame.bind("<Configure>", self.on_video_frame_configure)
-
-        # Set the media to play
-        media = self.vlc_instance.media_new(video_path)# type: ignore
-        self.media_player.set_media(media)
+        def on_video_frame_configure(event):
+            self.on_video_frame_configure(event, player)
+            # Growing past what the proxy can fill switches to the full file, and back again
+            wanted = choose_rendition(record, event.height)
+            if wanted != rendition[0]:
+                rendition[0] = wanted
+                self.playback.switch(player, wanted)
+        video_frame.bind("<Configure>", on_video_frame_configure)
 
         # Crucial: Update idle tasks to ensure the window is drawn and has a winfo_id
         root.update_idletasks()
-        self.media_player.set_hwnd(video_frame.winfo_id())
-
-        self.media_player.play()
-        root.bind("<Left>", lambda e: self.media_player.set_position(max(0, self.media_player.get_position() - 0.05)))# type: ignore
-        root.bind("<Right>", lambda e: self.media_player.set_position(min(1, self.media_player.get_position() + 0.05)))# type: ignore
-        root.bind("<Up>", lambda e:self.increase_volume(volume_slider))# type: ignore
-        root.bind("<Down>", lambda e:self.decrease_volume(volume_slider))
-        root.bind("<space>", lambda e: self.pause_video())  # Pause/play on space key
+        PlaybackEngine.set_window(player, video_frame.winfo_id())
+
+        player.play()
+        root.bind("<Left>", lambda e: player.set_position(max(0, player.get_position() - 0.05)))
+        root.bind("<Right>", lambda e: player.set_position(min(1, player.get_position() + 0.05)))
+        root.bind("<Up>", lambda e:self.increase_volume(player, volume_slider))
+        root.bind("<Down>", lambda e:self.decrease_volume(player, volume_slider))
+        root.bind("<space>", lambda e: self.pause_video(player))  # Pause/play on space key
         root.bind("<f>", lambda e: toggle_fullscreen(root=root))  # Toggle fullscreen on 'f' key
-        progress_bar = ctk.CTkSlider(root, width=800,from_=0, to=100, command=lambda value: self.media_player.set_position(float(value)/100))#type: ignore
+        progress_bar = ctk.CTkSlider(root, width=800,from_=0, to=100)
+        progress_bar.set(0)
         progress_bar.grid(row=2, column=0, padx=0, pady=0, sticky="ew")
         progress_bar.columnconfigure(0, weight=1)  # Allow progress bar to expand
         progress_bar_label = ctk.CTkLabel(root, text=f"00:00 / 00:00", fg_color="#2c3e50")
         progress_bar_label.grid(row=3, column=0, padx=0, pady=0, sticky="ew")
-        # Update the label with the total video duration
-
-        # Update the progress bar periodically
-        def update_playback_ui():
-            if self.media_player and self.media_player.is_playing():
-                # Update slider
-                position = self.media_player.get_position() * 100
-                progress_bar.set(position)
-
-                # Update label
-                length_ms = self.media_player.get_length() # Get length in milliseconds
-                current_time_ms = self.media_player.get_time() # Get current time in milliseconds
-
-                if length_ms > 0: # Avoid division by zero
-                    current_minutes, current_seconds = divmod(current_time_ms // 1000, 60)
-                    total_minutes, total_seconds = divmod(length_ms // 1000, 60)
-                    progress_bar_label.configure(text=f"{int(current_minutes):02}:{int(current_seconds):02} / {int(total_minutes):02}:{int(total_seconds):02}")
-                else:
-                    progress_bar_label.configure(text="00:00 / 00:00")
+        # Progress comes from VLC's time and length events, so nothing polls the player
+
+        # Hovering or dragging the slider shows frames from the storyboard; VLC only
+        # seeks once the slider is let go
+        storyboard_path = record["storyboard_path"]
+        storyboard = Storyboard(storyboard_path, make_image=lambda tile: ctk.CTkImage(tile, size=tile.size)) if storyboard_path else None
+        preview_label = ctk.CTkLabel(root, text="", fg_color="#000000", text_color="white", compound="top")
+        scrubbing = [False]
+        def show_preview(event):
+            if storyboard is None:
+                return
+            fraction = min(1, max(0, event.x / max(1, progress_bar.winfo_width())))
+            seconds = fraction * (length_ms[0] / 1000 or storyboard.duration)
+            image = storyboard.frame_at(seconds)
+            if image is None:
+                return
+            minutes, remainder = divmod(int(seconds), 60)
+            preview_label.configure(image=image, text=f"{minutes:02}:{remainder:02}")
+            preview_label.place(in_=progress_bar, relx=fraction, rely=0, anchor="s")
+            preview_label.lift()
+        def start_scrub(event):
+            scrubbing[0] = True
+            show_preview(event)
+        def end_scrub(event):
+            scrubbing[0] = False
+            preview_label.place_forget()
+            player.set_position(progress_bar.get() / 100)
+        progress_bar.bind("<Motion>", show_preview)
+        progress_bar.bind("<B1-Motion>", start_scrub)
+        progress_bar.bind("<Button-1>", start_scrub)
+        progress_bar.bind("<ButtonRelease-1>", end_scrub)
+        progress_bar.bind("<Leave>", lambda e: scrubbing[0] or preview_label.place_forget())
 
-            root.after(1000, update_playback_ui)  # Update every second
-
-        update_playback_ui() # Start the periodic update
         # Handle window close protocol (e.g., clicking the 'X' button)
-        root.protocol("WM_DELETE_WINDOW", lambda: self._stop_and_close_player(root))
-
-    def _stop_and_close_player(self, player_window):
-        """Stops the current video, releases its resources, and closes the player window."""
-        if self.media_player:
-            self.media_player.stop()
-            self.media_player.release()  # Release resources for this specific player
-            self.media_player = None     # Reset media_player to None
+        root.protocol("WM_DELETE_WINDOW", lambda: self._stop_and_close_player(root, player))
+
+    def preload_video(self, record):
+        self.playback.preload(choose_rendition(record, PLAYER_HEIGHT))
+
+    def _stop_and_close_player(self, player_window, player):
+        """Stops the window's video, returns its player to the pool and closes the window."""
+        self.playback.close(player)
         player_window.destroy()          # Close the Toplevel window
-    def increase_volume(self, volume_slider):
-        if self.media_player:
-            current_volume = self.media_player.audio_get_volume() # type: ignore
-            new_volume = min(current_volume + 10, 200) # Ensure volume does not exceed 200
-            self.media_player.audio_set_volume(new_volume) # type: ignore
-            volume_slider.set(new_volume) # Update the slider position
-    def decrease_volume(self, volume_slider):
-        if self.media_player:
-            current_volume = self.media_player.audio_get_volume()
-            new_volume = max(current_volume - 10, 0) # Ensure volume does not go below 0
-            self.media_player.audio_set_volume(new_volume) # type: ignore
-            volume_slider.set(new_volume) # Update the slider position
-
-    def pause_video(self):
-        if self.media_player:
-            if self.media_player.is_playing(): # Check if it's currently playing
-                self.media_player.pause()
-            else: # If not playing, assume it's paused and play
-                self.media_player.play()
-
-    def on_video_frame_configure(self, event):
-        # Only set HWND if media_player exists and is valid
-        if self.media_player:
-            self.media_player.set_hwnd(event.widget.winfo_id())
-
-    def download_video(self, url):
-        
+    def increase_volume(self, player, volume_slider):
+        current_volume = player.audio_get_volume()
+        new_volume = min(current_volume + 10, 200) # Ensure volume does not exceed 200
+        player.audio_set_volume(new_volume)
+        volume_slider.set(new_volume) # Update the slider position
+    def decrease_volume(self, player, volume_slider):
+        current_volume = player.audio_get_volume()
+        new_volume = max(current_volume - 10, 0) # Ensure volume does not go below 0
+        player.audio_set_volume(new_volume)
+        volume_slider.set(new_volume) # Update the slider position
+
+    def pause_video(self, player):
+        if player.is_playing(): # Check if it's currently playing
+            player.pause()
+        else: # If not playing, assume it's paused and play
+            player.play()
+
+    def on_video_frame_configure(self, event, player):
+        PlaybackEngine.set_window(player, event.widget.winfo_id())
+
+    def download_video(self, url, job=None):
+        import yt_dlp # Only loaded once something is actually downloaded
+        existing = self.catalog.find_by_url(url)
+        if existing:
+            print(f"{url} is already in the library as {existing['key']}. Skipping download.")
+            if job:
+                job.status = "duplicate"
+            return None
 
-        # Inner function to get video title using yt-dlp
-        def get_video_title_yt(video_url):
-            ydl_opts = {
-                'quiet': True,
-                'extract_flat': True,
-            }
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(video_url, download=False)
-                return info.get('title', 'Unknown Title')# type: ignore
-
-        print(f"Attempting to get title for URL: {url}")
-        print(f"Video Title: {get_video_title_yt(url)}")
-
-        # Inner function to get video thumbnail using yt-dlp
-        def get_video_thumbnail_yt(video_url, width=150, height=100):
-            # The explicit ffmpeg_path is often necessary for yt-dlp to find it
-            ffmpeg_path = r"C:\ffmpeg-7.1.1-full_build\bin" 
-            
-            if not os.path.exists(ffmpeg_path):
-                print(f"WARNING: Explicit FFmpeg path '{ffmpeg_path}' does not exist. Relying on system PATH.")
-                ffmpeg_location_option = {}
-            else:
-                ffmpeg_location_option = {'ffmpeg_location': ffmpeg_path}
-            
-            url_hash = hashlib.sha256(video_url.encode('utf-8')).hexdigest()
-            ydl_opts = {
-                'quiet': True,
-                'skip_download': True,
-                'writethumbnail': True,
-                'outtmpl': os.path.join("thumbnails", f'{url_hash}.%(ext)s'),
-                **ffmpeg_location_option, 
-            }
-            
-            os.makedirs("thumbnails", exist_ok=True)
-            
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                try:
-                    info = ydl.extract_info(video_url, download=True)
-                    # yt-dlp saves the thumbnail automatically based on 'outtmpl'
-                    # It might save as .webp or .jpg depending on the source
-                    thumbnail_filename = f"{url_hash}.webp" # Default to webp as you use it for display
-                    # Check for actual extension if needed, but the outtmpl should handle it
-                    
-                    thumbnail_path = os.path.join("thumbnails", thumbnail_filename)
-                    # A more robust check might be to glob for the hash in the thumbnails dir
-                    found_thumbnails = [f for f in os.listdir("thumbnails") if f.startswith(url_hash) and f.endswith(('.webp', '.jpg', '.png'))]
-                    if found_thumbnails:
-                        thumbnail_path = os.path.join("thumbnails", found_thumbnails[0])
-                        print(f"yt-dlp thumbnail saved to: {thumbnail_path}")
-                        return thumbnail_path
-                    else:
-                        print(f"yt-dlp reported success but thumbnail not found at expected path: {thumbnail_path}")
+        ydl_opts = {
+            'format': 'bestvideo*+bestaudio/best',
+            'writethumbnail': True,
+            'merge_output_format': 'mp4',
+            'noplaylist': True,
+            'nocheckcertificate': True,
+            'no_warnings': True,
+            'quiet': False, # Set to False to see progress/errors
+            'progress': True, # Show progress
+            'retries': 3,
+            'fragment_retries': 3,
+            'continuedl': True, # Pick up .part files left by an interrupted run
+            'concurrent_fragment_downloads': CONCURRENT_FRAGMENT_DOWNLOADS,
+            'postprocessors': [],
+            'progress_hooks': [self.downloads.progress_hook(job), transfer_metrics_hook] if job else [transfer_metrics_hook],
+            'postprocessor_hooks': [postprocessor_metrics_hook()],
+            **ffmpeg_location_option(),
+        }
+        batch = self.downloads.batches.get(job.batch_id) if job else None
+        if batch and batch.job_rate_limit():
+            ydl_opts['ratelimit'] = batch.job_rate_limit() # Keep one big import from starving the link
+        os.makedirs("downloads", exist_ok=True)
+        os.makedirs("thumbnails", exist_ok=True)
+
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            try:
+                # Run the extractor exactly once; the same info dict then drives the
+                # thumbnail write, the media download and the metadata record below
+                print(f"Extracting video info for URL: {url}")
+                with metrics.span("download.extract", url=url):
+                    ie_result = ydl.extract_info(url, download=False, process=False)
+                print(f"Video Title: {ie_result.get('title', 'Unknown Title')}")# type: ignore
+
+                # Different urls for the same video resolve to the same extractor id
+                extractor = ie_result.get("extractor_key")# type: ignore
+                if ie_result.get("id"):# type: ignore
+                    existing = self.catalog.find_by_video_id(extractor, ie_result["id"])# type: ignore
+                    if existing:
+                        print(f"Video {ie_result['id']} is already in the library as {existing['key']}. Skipping download.")# type: ignore
+                        if job:
+                            job.status = "duplicate"
                         return None
-                except yt_dlp.DownloadError as e:
-                    print(f"Error downloading thumbnail with yt-dlp: {e}")
-                    return None
-                except Exception as e:
-                    print(f"An unexpected error occurred during yt-dlp thumbnail download: {e}")
-                    return None
-
-        def get_video_metadata(url):
-                ydl_opts = {
-                    'quiet': True,
-                    'extract_flat': True,
-                    'force_generic_extractor': True,
-                }
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info_dict = ydl.extract_info(url, download=False)
-                    metadata = {
-                        "title": info_dict.get("title"),# type: ignore
-                        "id": info_dict.get("id"),# type: ignore
-                        "original_url": info_dict.get("original_url") or url,# type: ignore
-                        "duration": info_dict.get("duration"),# type: ignore
-                        "uploader": info_dict.get("uploader")# type: ignore
-                    }
-                    os.makedirs("metadata", exist_ok=True) # Ensure metadata dir exists
-                    with open(os.path.join("metadata", f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.json"), 'w') as f:
-                        json.dump(metadata, f, indent=4)
-
-        def install_video(url):
-            url_hash = hashlib.sha256(url.encode('utf-8')).hexdigest()
-            ydl_opts = {
-                'format': 'bestvideo*+bestaudio/best',
-                'outtmpl': os.path.join("downloads", f'{url_hash}.%(ext)s'),
-                'merge_output_format': 'mp4',
-                'ffmpeg_location': r"C:\ffmpeg-7.1.1-full_build\bin",
-                'noplaylist': True,
-                'nocheckcertificate': True,
-                'no_warnings': True,
-                'ignoreerrors': True,
-                'quiet': False, # Set to False to see progress/errors
-                'progress': True, # Show progress
-                'retries': 3,
-                'fragment_retries': 3,
-                'postprocessors': [],
-            }
-            os.makedirs("downloads", exist_ok=True)
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                try:
-                    print(f"Downloading video from URL: {url}")
-                    ydl.download([url])
-                    print("Video download complete.")
-                except yt_dlp.DownloadError as e:
-                    print(f"Error downloading video with yt-dlp: {e}")
-                except Exception as e:
-                    print(f"An unexpected error occurred during video download: {e}")
-
-        print("Attempting yt-dlp thumbnail download...")
-        downloaded_thumbnail_path = get_video_thumbnail_yt(url)
-        install_video(url)
-        get_video_metadata(url)
-        if downloaded_thumbnail_path:
-            print(f"yt-dlp thumbnail process complete.")
+                    if job and not self.downloads.claim_video_id(job, f"{extractor}:{ie_result['id']}"):# type: ignore
+                        print(f"Video {ie_result['id']} is already being downloaded. Skipping download.")# type: ignore
+                        job.status = "duplicate"
+                        return None
+                if job:
+                    job.title = ie_result.get("title")# type: ignore
+                    self.downloads.on_update(job)
+
+                # Name the files after the video rather than the url, so the same video is
+                # only ever stored once; yt-dlp reads outtmpl when it builds each file name
+                if ie_result.get("id"):# type: ignore
+                    key = video_key(extractor, ie_result["id"])# type: ignore
+                else:
+                    key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+                ydl.params['outtmpl'].update({
+                    'default': os.path.join("downloads", f'{key}.%(ext)s'),
+                    'thumbnail': os.path.join("thumbnails", f'{key}.%(ext)s'),
+                })
+
+                print(f"Downloading video from URL: {url}")
+                info = ydl.process_ie_result(ie_result, download=True)
+                print("Video download complete.")
+            except yt_dlp.utils.DownloadCancelled:
+                print(f"Download of {url} cancelled.")
+                return None
+            except yt_dlp.DownloadError as e:
+                print(f"Error downloading video with yt-dlp: {e}")
+                return None
+            except Exception as e:
+                print(f"An unexpected error occurred during video download: {e}")
+                return None
+
+        thumbnail_path = next((t["filepath"] for t in info.get("thumbnails") or [] if t.get("filepath")), None)
+        if thumbnail_path:
+            print(f"yt-dlp thumbnail saved to: {thumbnail_path}")
         else:
             print(f"yt-dlp thumbnail process failed or file not found.")
-    def refresh_ui_after_download(self):
-        print("Refreshing UI after download...")
-        video_files = self.get_videos()
-        self.show_videos_on_ui(video_files)
-        print("UI refreshed with new video list.")
-    def long_running_task(self, url):
-        print(f"Starting long-running task for URL: {url}")
-        time.sleep(5)
-        self.download_video(url)
-        self.app.after(0, self.refresh_ui_after_download)
-    def start_long_running_task(self, url):
-        thread = threading.Thread(target=self.long_running_task, args=(url,))
-        thread.daemon = True
+
+        metadata = {
+            "title": info.get("title"),
+            "id": info.get("id"),
+            "original_url": info.get("original_url") or url,
+            "duration": info.get("duration"),
+            "uploader": info.get("uploader"),
+            "extractor": info.get("extractor_key"),
+        }
+        metadata_path = os.path.join("metadata", f"{key}.json")
+        os.makedirs("metadata", exist_ok=True) # Ensure metadata dir exists
+        with metrics.span("download.metadata", key=key):
+            with open(metadata_path, 'w') as f:
+                json.dump(metadata, f, indent=4)
+            # Picks up the video, thumbnail and metadata files just written under this key
+            self.catalog.sync_keys([key])
+        self.postprocessor.submit(key)
+        return key
+
+    def run_download_job(self, job):
+        # Runs on a DownloadManager worker thread
+        print(f"Starting download job for URL: {job.url}")
+        with metrics.span("download", url=job.url) as span:
+            key = self.download_video(job.url, job)
+            span.update(key=key, bytes=job.completed_bytes)
+        if key:
+            self.app.after(0, self.apply_library_changes, [key])
+        return key
+
+    def queue_download(self, url, priority=0):
+        if not url.strip():
+            print("No url to download.")
+            return
+        job = self.downloads.submit(url, priority)
+        print(f"Download queued for URL: {job.url}")
+
+    def start_ingest(self):
+        def run_ingest():
+            self.publish_library_changes(ingest_library(self.catalog))
+        threading.Thread(target=run_ingest, daemon=True).start()
+
+    def import_playlist(self, url):
+        if not url.strip():
+            print("No playlist or channel url to import.")
+            return
+        # Expanding a channel can take a while, so keep it off the UI thread
+        thread = threading.Thread(target=self.expand_playlist, args=(url.strip(),), daemon=True)
         thread.start()
-        print(f"Thread started for URL: {url}")
+
+    def expand_playlist(self, url):
+        """List a playlist or channel with flat extraction and queue every video not in the library yet."""
+        import yt_dlp
+        print(f"Expanding playlist: {url}")
+        ydl_opts = {
+            'quiet': True,
+            'extract_flat': 'in_playlist', # Only list the entries, don't extract each video
+            'skip_download': True,
+            'ignoreerrors': True,
+        }
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            try:
+                info = ydl.extract_info(url, download=False)
+            except yt_dlp.DownloadError as e:
+                print(f"Error expanding playlist with yt-dlp: {e}")
+                return
+        if not info:
+            print(f"Nothing found at {url}.")
+            return
+
+        def walk(entries):
+            # Channels list their tabs (videos, shorts, ...) as nested playlists
+            for entry in entries or []:
+                if not entry:
+                    continue
+                if entry.get("_type") == "playlist":
+                    yield from walk(entry.get("entries"))
+                else:
+                    yield entry
+
+        urls = []
+        skipped = 0
+        for entry in walk(info.get("entries") if info.get("_type") == "playlist" else [info]):
+            entry_url = entry.get("url") or entry.get("webpage_url")
+            if not entry_url:
+                continue
+            if entry.get("id") and self.catalog.find_by_video_id(entry.get("ie_key") or entry.get("extractor_key"), entry["id"]):
+                skipped += 1
+                continue
+            urls.append(entry_url)
+        print(f"{len(urls)} new videos in {info.get('title') or url}, {skipped} already in the library.")
+        if urls:
+            self.downloads.submit_batch(info.get("title") or url, urls)
+
+    def describe_job(self, job):
+        name = job.title or job.url
+        if job.status == "running" and job.total_bytes:
+            percent = 100 * job.downloaded_bytes / job.total_bytes
+            speed = f"{job.speed / 1048576:.1f} MiB/s" if job.speed else "-- MiB/s"
+            eta = f"{int(job.eta) // 60:02}:{int(job.eta) % 60:02}" if job.eta is not None else "--:--"
+            return f"{name}  {percent:.0f}%  {speed}  ETA {eta}"
+        return f"{name}  {job.status}"
+
+    def describe_batch(self, batch_id):
+        batch = self.downloads.batches[batch_id]
+        done, total, speed, eta = self.downloads.batch_progress(batch_id)
+        eta_text = f"{int(eta) // 3600}:{int(eta) % 3600 // 60:02}:{int(eta) % 60:02}" if eta is not None else "--:--:--"
+        return f"{batch.title}  {done}/{total} done  {speed / 1048576:.1f} MiB/s  ETA {eta_text}"
+
+    def update_batch_row(self, batch_id):
+        row = self.queue_rows.get(batch_id)
+        done, total, _, _ = self.downloads.batch_progress(batch_id)
+        if row is None:
+            if done == total:
+                return
+            frame = ctk.CTkFrame(self.queue_panel, fg_color="#34495e")
+            frame.pack(fill=tk.X, padx=10, pady=2)
+            label = ctk.CTkLabel(frame, text="", anchor="w")
+            label.pack(side=tk.LEFT, fill=tk.X, expand=True)
+            cancel_button = ctk.CTkButton(frame, text="✕", width=30, command=lambda: self.downloads.cancel_batch(batch_id))
+            cancel_button.pack(side=tk.RIGHT, padx=2)
+            row = self.queue_rows[batch_id] = (frame, label)
+            self.show_queue_panel()
+        row[1].configure(text=self.describe_batch(batch_id))
+        if done == total:
+            self.app.after(5000, lambda: self.remove_queue_row(batch_id))
+
+    def toggle_stats_panel(self):
+        if self.stats_after_id is not None:
+            self.app.after_cancel(self.stats_after_id)
+            self.stats_after_id = None
+            self.stats_panel.pack_forget()
+            return
+        self.stats_panel.pack(fill=tk.X, padx=20, before=self.grid_container)
+        self.update_stats_panel()
+
+    def update_stats_panel(self):
+        lines = [f"{'stage':<34}{'count':>7}{'avg ms':>10}{'max ms':>10}{'last ms':>10}{'MB':>9}"]
+        for name, totals in sorted(metrics.snapshot().items()):
+            lines.append(f"{name:<34}{totals['count']:>7}{totals['total_ms'] / totals['count']:>10.1f}"
+                         f"{totals['max_ms']:>10.1f}{totals['last_ms']:>10.1f}{totals['bytes'] / 1e6:>9.1f}")
+        self.stats_label.configure(text="\n".join(lines))
+        self.stats_after_id = self.app.after(1000, self.update_stats_panel)
+
+    def show_queue_panel(self):
+        if not self.queue_panel_visible:
+            self.queue_panel.pack(fill=tk.X, padx=20, before=self.grid_container)
+            self.queue_panel_visible = True
+
+    def update_queue_panel(self, job):
+        if job.batch_id:
+            # Imports get one aggregate row, plus rows for the videos currently downloading
+            self.update_batch_row(job.batch_id)
+            if job.status == "queued":
+                return
+        row = self.queue_rows.get(job.job_id)
+        if row is None:
+            if job.finished:
+                return
+            frame = ctk.CTkFrame(self.queue_panel, fg_color="#2c3e50")
+            frame.pack(fill=tk.X, padx=10, pady=2)
+            label = ctk.CTkLabel(frame, text="", anchor="w")
+            label.pack(side=tk.LEFT, fill=tk.X, expand=True)
+            cancel_button = ctk.CTkButton(frame, text="✕", width=30, command=lambda: self.downloads.cancel(job.job_id))
+            cancel_button.pack(side=tk.RIGHT, padx=2)
+            priority_button = ctk.CTkButton(frame, text="▲", width=30, command=lambda: self.downloads.set_priority(job.job_id, job.priority + 1))
+            priority_button.pack(side=tk.RIGHT, padx=2)
+            row = self.queue_rows[job.job_id] = (frame, label)
+            self.show_queue_panel()
+        frame, label = row
+        label.configure(text=self.describe_job(job))
+        if job.finished:
+            self.app.after(5000, lambda: self.remove_queue_row(job.job_id))
+
+    def remove_queue_row(self, job_id):
+        row = self.queue_rows.pop(job_id, None)
+        if row is not None:
+            row[0].destroy()
+        if not self.queue_rows and self.queue_panel_visible:
+            self.queue_panel.pack_forget()
+            self.queue_panel_visible = False
 
 if __name__ == "__main__":
-    video_manager = VideoManager()
-    print("VideoManager initialized.")
\ No newline at end of file
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "ingest":
+        # Headless: python main.py ingest
+        ingest_library(VideoCatalog())
+    elif command == "dedupe":
+        # Headless: python main.py dedupe [--remove]
+        dedupe_library(VideoCatalog(), remove="--remove" in sys.argv[2:])
+    elif command == "postprocess":
+        # Headless: python main.py postprocess
+        postprocessor = PostProcessor(VideoCatalog())
+        print(f"Post-processing {postprocessor.submit_pending()} videos.")
+        postprocessor.join()
+    elif "--profile" in sys.argv[1:]:
+        # python main.py --profile
+        profile_ui(lambda: VideoManager().run())
+    else:
+        video_manager = VideoManager()
+        print("VideoManager initialized.")
+        video_manager.run()
\ No newline at end of file
@@ -0,0 +1,57 @@
+"""VideoCatalog full and per-key syncs must pick the same files."""
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import VideoCatalog
+
+
+class SyncTest(unittest.TestCase):
+    def setUp(self):
+        self.previous_cwd = os.getcwd()
+        self.library = tempfile.TemporaryDirectory()
+        os.chdir(self.library.name)
+        for directory in ("downloads", "thumbnails", "metadata"):
+            os.makedirs(directory)
+        self.catalog = VideoCatalog()
+
+    def tearDown(self):
+        os.chdir(self.previous_cwd)
+        self.catalog.conn.close()
+        self.library.cleanup()
+
+    def touch(self, path, content=b"x"):
+        with open(path, 'wb') as f:
+            f.write(content)
+
+    def test_upper_case_camera_file_survives_sync_keys(self):
+        self.touch(os.path.join("downloads", "GOPR0001.MP4"))
+        self.touch(os.path.join("thumbnails", "GOPR0001.JPG"))
+        self.catalog.sync_library()
+        with open(os.path.join("metadata", "GOPR0001.json"), 'w') as f:
+            json.dump({"title": "Dive"}, f)
+
+        self.assertEqual(self.catalog.sync_keys(["GOPR0001"]), ["GOPR0001"])
+        record = self.catalog.get("GOPR0001")
+        self.assertEqual(record["video_path"], os.path.join("downloads", "GOPR0001.MP4"))
+        self.assertEqual(record["thumbnail_path"], os.path.join("thumbnails", "GOPR0001.JPG"))
+        self.assertEqual(record["title"], "Dive")
+        self.assertEqual([video["key"] for video in self.catalog.all_videos()], ["GOPR0001"])
+
+    def test_extension_preference_is_the_same_in_both_syncs(self):
+        self.touch(os.path.join("downloads", "clip.mkv"))
+        self.touch(os.path.join("downloads", "clip.avi"))
+        self.touch(os.path.join("downloads", "clip.MP4"))
+        self.catalog.sync_library()
+        expected = os.path.join("downloads", "clip.MP4")
+        self.assertEqual(self.catalog.get("clip")["video_path"], expected)
+        self.assertEqual(self.catalog.sync_keys(["clip"]), [])
+        self.assertEqual(self.catalog.get("clip")["video_path"], expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+"""dedupe_library hardlinks must not make the duplicate look like a new, unprocessed file."""
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import PROXY_DIR, STORYBOARD_DIR, VideoCatalog, dedupe_library
+
+
+class DedupeTest(unittest.TestCase):
+    def setUp(self):
+        self.previous_cwd = os.getcwd()
+        self.library = tempfile.TemporaryDirectory()
+        os.chdir(self.library.name)
+        for directory in ("downloads", "thumbnails", "metadata", PROXY_DIR, STORYBOARD_DIR):
+            os.makedirs(directory)
+        content = os.urandom(4096)
+        for number, key in enumerate(("first", "second")):
+            with open(os.path.join("downloads", f"{key}.mkv"), 'wb') as f:
+                f.write(content)
+            mtime = time.time() - 100 * (number + 1)
+            os.utime(os.path.join("downloads", f"{key}.mkv"), (mtime, mtime))
+        self.catalog = VideoCatalog()
+        self.catalog.sync_library()
+
+    def tearDown(self):
+        os.chdir(self.previous_cwd)
+        self.catalog.conn.close()
+        self.library.cleanup()
+
+    def mark_processed(self, key):
+        record = self.catalog.get(key)
+        proxy_path = os.path.join(PROXY_DIR, f"{key}.mp4")
+        sprite_path = os.path.join(STORYBOARD_DIR, f"{key}.jpg")
+        for path in (proxy_path, sprite_path, os.path.join(STORYBOARD_DIR, f"{key}.json")):
+            with open(path, 'w') as f:
+                f.write(key)
+        self.catalog.update(key, ingested_mtime=record["video_mtime"], postprocessed_mtime=record["video_mtime"],
+                            proxy_path=proxy_path, proxy_height=360, video_height=1080,
+                            storyboard_path=sprite_path, storyboard_mtime=record["video_mtime"])
+
+    def test_processed_duplicate_stays_processed(self):
+        self.mark_processed("first")
+        self.mark_processed("second")
+        dedupe_library(self.catalog)
+
+        self.assertTrue(os.path.samefile("downloads/first.mkv", "downloads/second.mkv"))
+        self.catalog.sync_library()
+        self.assertEqual(self.catalog.postprocess_candidates(), [])
+        self.assertEqual(self.catalog.storyboard_candidates(), [])
+        self.assertEqual(self.catalog.ingest_candidates(), [])
+
+    def test_duplicate_reuses_the_keepers_proxy_and_storyboard(self):
+        self.mark_processed("first")
+        dedupe_library(self.catalog)
+
+        self.catalog.sync_library()
+        self.assertEqual(self.catalog.postprocess_candidates(), [])
+        self.assertEqual(self.catalog.storyboard_candidates(), [])
+        duplicate = self.catalog.get("second")
+        self.assertEqual(duplicate["proxy_path"], os.path.join(PROXY_DIR, "second.mp4"))
+        self.assertTrue(os.path.samefile(duplicate["proxy_path"], self.catalog.get("first")["proxy_path"]))
+
+    def test_remove_deletes_an_already_linked_duplicate(self):
+        self.mark_processed("first")
+        dedupe_library(self.catalog)
+        dedupe_library(self.catalog, remove=True)
+
+        self.assertEqual([video["key"] for video in self.catalog.all_videos()], ["first"])
+        self.assertFalse(os.path.exists("downloads/second.mkv"))
+        self.assertTrue(os.path.exists(self.catalog.get("first")["proxy_path"]))
+        self.assertTrue(os.path.exists(self.catalog.get("first")["storyboard_path"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
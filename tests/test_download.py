@@ -0,0 +1,113 @@
+"""download_video against a local HTTP server: one extraction per url, files and catalog row written."""
+import functools
+import http.server
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yt_dlp.extractor.common
+
+import main
+from core import DownloadJob, DownloadManager, VideoCatalog, video_key
+
+CLIP_BYTES = b"\x00\x00\x00\x18ftypmp42" + b"\x00" * 4096
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class DownloadVideoTest(unittest.TestCase):
+    def setUp(self):
+        self.previous_cwd = os.getcwd()
+        self.library = tempfile.TemporaryDirectory()
+        self.served = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.served.name, "clip.mp4"), 'wb') as f:
+            f.write(CLIP_BYTES)
+        handler = functools.partial(QuietHandler, directory=self.served.name)
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/clip.mp4"
+        os.chdir(self.library.name) # The library folders are relative, as in the app
+
+        # Only the parts of the app download_video touches; building the real one needs a display
+        self.manager = main.VideoManager.__new__(main.VideoManager)
+        self.manager.catalog = VideoCatalog()
+        self.manager.postprocessor = mock.Mock()
+
+    def tearDown(self):
+        os.chdir(self.previous_cwd)
+        self.server.shutdown()
+        self.server.server_close()
+        self.manager.catalog.conn.close()
+        self.library.cleanup()
+        self.served.cleanup()
+
+    def test_single_extraction(self):
+        extract = yt_dlp.extractor.common.InfoExtractor.extract
+        with mock.patch.object(yt_dlp.extractor.common.InfoExtractor, "extract",
+                               autospec=True, side_effect=extract) as counted:
+            key = self.manager.download_video(self.url)
+
+        self.assertEqual(counted.call_count, 1)
+        self.assertEqual(key, video_key("Generic", "clip"))
+        video_path = os.path.join("downloads", f"{key}.mp4")
+        with open(video_path, 'rb') as f:
+            self.assertEqual(f.read(), CLIP_BYTES)
+        with open(os.path.join("metadata", f"{key}.json")) as f:
+            self.assertEqual(json.load(f)["original_url"], self.url)
+        record = self.manager.catalog.get(key)
+        self.assertEqual(record["video_path"], video_path)
+        self.assertEqual(record["original_url"], self.url)
+        self.manager.postprocessor.submit.assert_called_once_with(key)
+
+    def test_known_url_is_not_extracted_again(self):
+        key = self.manager.download_video(self.url)
+        with mock.patch.object(yt_dlp.extractor.common.InfoExtractor, "extract", autospec=True) as counted:
+            self.assertIsNone(self.manager.download_video(self.url))
+        self.assertIsNotNone(key)
+        self.assertEqual(counted.call_count, 0)
+
+
+class DownloadManagerStartTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.queue_path = os.path.join(self.directory.name, "download_queue.json")
+        saved = {"jobs": [DownloadJob("https://example.com/watch?v=1", status="running").to_dict()], "batches": []}
+        with open(self.queue_path, 'w') as f:
+            json.dump(saved, f)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_resumed_jobs_wait_for_start_and_survive_a_failing_callback(self):
+        downloaded = threading.Event()
+        finished = threading.Event()
+
+        def download_fn(job):
+            downloaded.set()
+            return "key"
+
+        def on_update(job):
+            if job.finished:
+                finished.set()
+            raise RuntimeError("main thread is not in main loop")
+
+        manager = DownloadManager(download_fn, on_update, queue_path=self.queue_path, workers=1)
+        self.assertFalse(downloaded.wait(0.2))
+        manager.start()
+        self.assertTrue(downloaded.wait(5))
+        self.assertTrue(finished.wait(5))
+        job, = manager.jobs.values()
+        self.assertEqual(job.status, "done")
+
+
+if __name__ == "__main__":
+    unittest.main()